@@ -0,0 +1,173 @@
+import csv
+import sys
+
+AGENT_FIELDS = ("agent", "gender", "age", "status", "origin")
+
+
+class AgentRegistry:
+    """
+    Interns each distinct (agent, gender, age, status, origin) once, as a
+    tuple of interned strings, and gives it an integer id starting at 1.
+    Repeated agents such as "Chorus" then cost one id instead of a new
+    dict per oath.
+
+        registry = AgentRegistry()
+        agent_id = registry.intern({"agent": "Chorus", "gender": "male", ...})
+        registry.get(agent_id)  # -> the agent dict again
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.agents = []
+        # agent name -> ids of every attribute set seen with that name
+        self.name_ids = {}
+
+    def __len__(self):
+        return len(self.agents)
+
+    def intern(self, agent):
+        """
+        The id of agent (a dict with AGENT_FIELDS), registering it if new
+        """
+        key = tuple(sys.intern(agent[field]) for field in AGENT_FIELDS)
+        agent_id = self.ids.get(key)
+        if agent_id is None:
+            self.agents.append(key)
+            agent_id = self.ids[key] = len(self.agents)
+            self.name_ids.setdefault(key[0], []).append(agent_id)
+        return agent_id
+
+    def has_name(self, name):
+        return name in self.name_ids
+
+    def get(self, agent_id):
+        return dict(zip(AGENT_FIELDS, self.agents[agent_id - 1]))
+
+    def first_by_name(self):
+        """
+        The first attribute set seen for each name, in first-seen order
+        (what unique_dicts_by_key(agents, "agent") gives)
+        """
+        return [self.get(ids[0]) for ids in self.name_ids.values()]
+
+    def conflicts(self):
+        """
+        {name: [agent dicts]} for names seen with more than one attribute set
+        """
+        return {
+            name: [self.get(agent_id) for agent_id in ids]
+            for name, ids in self.name_ids.items()
+            if len(ids) > 1
+        }
+
+    def report_conflicts(self):
+        conflicts = self.conflicts()
+        for name, agents in conflicts.items():
+            variants = "; ".join(
+                ", ".join(agent[field] for field in AGENT_FIELDS[1:])
+                for agent in agents
+            )
+            sys.stderr.write(
+                f"Agent {name} has {len(agents)} attribute sets: {variants}\n"
+            )
+        if conflicts:
+            sys.stderr.write(
+                f"{len(conflicts)} agent name(s) with conflicting attributes\n"
+            )
+
+    @classmethod
+    def read_csv(cls, path):
+        """
+        A registry with the agents of a table written by write_csv, under
+        the same ids
+        """
+        registry = cls()
+        with open(path, newline="") as csvfile:
+            for row in csv.DictReader(csvfile):
+                agent_id = registry.intern(row)
+                if agent_id != int(row["agent_id"]):
+                    raise ValueError(
+                        f"{path}: agent {row['agent_id']} is out of order or repeated"
+                    )
+        return registry
+
+    def write_csv(self, path):
+        """
+        Write every interned agent, with its id, to path
+        """
+        with open(path, "w", newline="") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(("agent_id", *AGENT_FIELDS))
+            for agent_id, agent in enumerate(self.agents, 1):
+                writer.writerow((agent_id, *agent))
+
+
+def intern_agents(registry, oath):
+    """
+    Replace the swearer and swearee dicts of an extracted oath with their
+    registry ids, in place
+    """
+    for role in ("swearer", "swearee"):
+        if role in oath:
+            oath[role] = [registry.intern(agent) for agent in oath[role]]
+    return oath
+
+
+def resolve_agents(registry, oath):
+    """
+    Replace the swearer and swearee ids of an oath from intern_agents with
+    their agent dicts again, in place
+    """
+    for role in ("swearer", "swearee"):
+        if role in oath:
+            oath[role] = [
+                registry.get(agent) if isinstance(agent, int) else agent
+                for agent in oath[role]
+            ]
+    return oath
+
+
+def agent_ids(oath):
+    """
+    (role, id) of each swearer and swearee of an oath given as an id
+    """
+    return [
+        (role, agent)
+        for role in ("swearer", "swearee")
+        for agent in oath.get(role, ())
+        if isinstance(agent, int)
+    ]
+
+
+def add_agent_table_argument(parser):
+    parser.add_argument(
+        "--agent-table",
+        metavar="FILE",
+        help="read swearers and swearees given as ids (transform.py "
+        "--agent-table) through the agent table in FILE",
+    )
+
+
+def agent_records(records, args, parser):
+    """
+    The extracted oaths of records, with any swearer and swearee ids
+    resolved through the table of add_agent_table_argument; an id without
+    a table, or not in it, is a usage error
+    """
+    registry = AgentRegistry.read_csv(args.agent_table) if args.agent_table else None
+    for oath in records:
+        for role, agent_id in agent_ids(oath):
+            if registry is None:
+                parser.error(
+                    f"oath {oath.get('oath_id')} gives its {role} as an agent id "
+                    "(transform.py --agent-table); pass that table with "
+                    "--agent-table FILE"
+                )
+            if not 0 < agent_id <= len(registry):
+                parser.error(
+                    f"oath {oath.get('oath_id')} has {role} id {agent_id}, "
+                    f"which is not in {args.agent_table}"
+                )
+        if registry is not None:
+            resolve_agents(registry, oath)
+        yield oath
@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import bs4
+
+from pages import oath_files, read_page
+from transform import (
+    DERIVED_FIELDS,
+    EXTRACTOR_VERSION,
+    PARSERS,
+    Profiler,
+    Scraper,
+    extract_paths,
+    feature_name_from_label,
+    filter_to_features,
+    handle_h2,
+    installed_parser,
+    table_rows,
+    text_value,
+)
+
+
+def benchmark_pages(paths, parser="html.parser", content_only=False):
+    """
+    Extract paths one stage at a time, timing each: file read, soupify,
+    title, handle_h2, table_rows, filter_to_features, each field's value
+    extractor and derived field (as field:<key>) and json.dumps
+    """
+    timer = Profiler()
+    scraper = Scraper(parser, content_only=content_only)
+    clock = time.perf_counter
+    for path in paths:
+        scraper.current_file = os.path.basename(path)
+        start = clock()
+        html = read_page(path)
+        read_seconds = clock() - start
+        timer.record("read", read_seconds)
+
+        page_start = start = clock()
+        scraper.soupify(html)
+        timer.record("soupify", clock() - start)
+
+        start = clock()
+        features = {}
+        title = scraper.soup.find("title")
+        if title:
+            try:
+                features["oath_id"] = int(title.get_text(strip=True).split()[1])
+            except ValueError:
+                pass
+        timer.record("title", clock() - start)
+        if not features:
+            continue
+
+        start = clock()
+        h2 = scraper.soup.select_one("#content h2")
+        if h2:
+            features.update(handle_h2(h2))
+        timer.record("handle_h2", clock() - start)
+
+        start = clock()
+        rows = table_rows(scraper.soup)
+        timer.record("table_rows", clock() - start)
+
+        start = clock()
+        fields = list(filter_to_features(rows))
+        timer.record("filter_to_features", clock() - start)
+
+        for label, value in fields:
+            start = clock()
+            field = scraper.plan.get(label)
+            if field:
+                key, extract_value = field
+            else:
+                key, extract_value = feature_name_from_label(label), text_value
+            features[key] = extract_value(key, value)
+            timer.record(f"field:{key}", clock() - start)
+            if key in DERIVED_FIELDS:
+                start = clock()
+                derived_key, derive = DERIVED_FIELDS[key]
+                features[derived_key] = derive(features[key])
+                timer.record(f"field:{derived_key}", clock() - start)
+
+        start = clock()
+        json.dumps(features)
+        timer.record("json_dumps", clock() - start)
+        timer.record_file(scraper.current_file, read_seconds + clock() - page_start)
+    return timer
+
+
+def sample_paths(directory, sample=None, seed=0):
+    paths = [os.path.join(directory, file) for file in oath_files(directory)]
+    if sample and sample < len(paths):
+        paths = sorted(random.Random(seed).sample(paths, sample))
+    return paths
+
+
+def run_benchmark(
+    directory, sample=None, seed=0, parser="html.parser", content_only=False, jobs=0
+):
+    """
+    Benchmark the extraction stages over directory (or a seeded sample of
+    it) and, if jobs is set, the end-to-end run with that many processes.
+    Returns a JSON-serializable report.
+    """
+    paths = sample_paths(directory, sample, seed)
+    start = time.perf_counter()
+    timer = benchmark_pages(paths, parser, content_only)
+    staged_seconds = time.perf_counter() - start
+    report = {
+        "settings": {
+            "directory": directory,
+            "sample": sample,
+            "seed": seed,
+            "parser": parser,
+            "content_only": content_only,
+            "jobs": jobs,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "bs4": bs4.__version__,
+            "extractor_version": EXTRACTOR_VERSION,
+            "cpus": os.cpu_count(),
+        },
+        "pages": len(paths),
+        "seconds": round(staged_seconds, 6),
+        "stages": timer.counters(),
+        "slowest_files": timer.slowest(),
+    }
+    if jobs:
+        options = {"parser": parser, "content_only": content_only}
+        start = time.perf_counter()
+        for _ in extract_paths(paths, jobs, None, options):
+            pass
+        seconds = time.perf_counter() - start
+        report["end_to_end"] = {
+            "jobs": jobs,
+            "seconds": round(seconds, 6),
+            "pages_per_second": round(len(paths) / seconds, 1),
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time each stage of extraction over a directory of oath pages "
+        "and print the results as JSON"
+    )
+    parser.add_argument("directory", nargs="?", default="oaths")
+    parser.add_argument(
+        "-n", "--sample", type=int, help="benchmark a random sample of this many pages"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="random seed for --sample (default: 0)"
+    )
+    parser.add_argument(
+        "--parser", type=installed_parser, choices=PARSERS, default="html.parser"
+    )
+    parser.add_argument("--content-only", action="store_true")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=0,
+        help="also time a full run with this many processes",
+    )
+    parser.add_argument("-o", "--output", help="write the report here, not stdout")
+    args = parser.parse_args(argv)
+    report = run_benchmark(
+        args.directory,
+        args.sample,
+        args.seed,
+        args.parser,
+        args.content_only,
+        args.jobs,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+import os
+from functools import partial
+
+from playwright.async_api import Error, async_playwright
+
+from fetch import (
+    BASE_URL,
+    HEADERS,
+    TIMED_OUT,
+    RateController,
+    page_is_invalid,
+    page_url,
+    write_atomically,
+)
+from transform import err_print
+
+# usedJSHeapSize is only reported by Chromium; other engines give 0
+HEAP_SIZE_SCRIPT = "() => performance.memory ? performance.memory.usedJSHeapSize : 0"
+
+
+class PooledPage:
+    """
+    A browser context with its one page, how many navigations the page
+    has served, and whether it must be replaced before the next one
+    """
+
+    def __init__(self, context, page):
+        self.context = context
+        self.page = page
+        self.uses = 0
+        self.broken = False
+        page.on("crash", self.on_crash)
+
+    def on_crash(self, page):
+        err_print("Browser page crashed")
+        self.broken = True
+
+
+class BrowserPool:
+    """
+    size browser contexts, one page each, shared by concurrent navigations
+    instead of a new page per oath. A context is closed and replaced after
+    max_uses navigations, or once its page's JavaScript heap passes
+    max_memory bytes (Chromium only), and restarted when its page crashes
+    or a navigation fails; a disconnected browser is relaunched.
+
+        async with BrowserPool(size=4) as pool:
+            html = await pool.run(partial(url_content, number=2))
+    """
+
+    def __init__(
+        self, size=4, max_uses=100, max_memory=None, browser="webkit", timeout=30
+    ):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_memory = max_memory
+        self.browser_name = browser
+        self.timeout = timeout
+        self.playwright = None
+        self.browser = None
+        self.idle = asyncio.Queue()
+        self.launching = asyncio.Lock()
+        self.recycled = 0
+        self.restarted = 0
+
+    async def __aenter__(self):
+        self.playwright = await async_playwright().start()
+        await self.launch()
+        for _ in range(self.size):
+            self.idle.put_nowait(await self.new_page())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def launch(self):
+        err_print(f"Launching {self.browser_name}")
+        browser_type = getattr(self.playwright, self.browser_name)
+        self.browser = await browser_type.launch(headless=True)
+
+    async def new_page(self):
+        async with self.launching:
+            if not self.browser.is_connected():
+                err_print("Browser disconnected")
+                await self.launch()
+        context = await self.browser.new_context(user_agent=HEADERS["User-Agent"])
+        context.set_default_timeout(self.timeout * 1000)
+        return PooledPage(context, await context.new_page())
+
+    async def renew(self, pooled):
+        """
+        A fresh context and page in place of pooled's; if that fails too,
+        pooled, still marked broken so the next use tries again
+        """
+        try:
+            await pooled.context.close()
+        except Error:
+            pass  # gone already with a crashed page or browser
+        try:
+            return await self.new_page()
+        except Error as e:
+            err_print(f"Could not open a browser context: {e}")
+            pooled.broken = True
+            return pooled
+
+    async def worn_out(self, pooled):
+        if pooled.uses >= self.max_uses:
+            return True
+        if not self.max_memory:
+            return False
+        try:
+            return await pooled.page.evaluate(HEAP_SIZE_SCRIPT) > self.max_memory
+        except Error:
+            return True
+
+    async def run(self, action):
+        """
+        await action(page) on an idle pooled page and return its result. If
+        the page crashes or action fails, the context is restarted and
+        action tried once more on the new page.
+        """
+        pooled = await self.idle.get()
+        try:
+            for attempt in range(2):
+                if pooled.broken:
+                    self.restarted += 1
+                    pooled = await self.renew(pooled)
+                try:
+                    result = await action(pooled.page)
+                except Error as e:
+                    if attempt:
+                        raise
+                    err_print(f"Restarting browser context after: {e}")
+                    pooled.broken = True
+                    continue
+                pooled.uses += 1
+                if await self.worn_out(pooled):
+                    self.recycled += 1
+                    pooled = await self.renew(pooled)
+                return result
+        finally:
+            self.idle.put_nowait(pooled)
+
+    def stats(self):
+        return f"{self.recycled} pages recycled, {self.restarted} contexts restarted"
+
+    async def close(self):
+        while not self.idle.empty():
+            try:
+                await self.idle.get_nowait().context.close()
+            except Error:
+                pass
+        if self.browser is not None:
+            await self.browser.close()
+        if self.playwright is not None:
+            await self.playwright.stop()
+
+
+async def url_content(page, number, base_url=BASE_URL):
+    """
+    The page for oath number, navigated to by its URL
+    """
+    await page.goto(page_url(number, base_url))
+    return await page.content()
+
+
+async def search_form_content(page, number, base_url=BASE_URL):
+    """
+    The page for oath number, found by filling in the site's search form
+    """
+    await page.goto(base_url)
+    await page.locator("#oathReferenceID").fill(str(number))
+    async with page.expect_navigation():
+        await page.get_by_role("button", name="Search").first.click()
+    return await page.content()
+
+
+async def fetch_pages(pool, numbers, directory, action, controller=None):
+    """
+    Save the page await action(page, number) gives for each oath number
+    to directory, skipping pages already saved; returns (fetched,
+    invalid, failed)
+    """
+    counts = {"fetched": 0, "invalid": 0, "failed": 0}
+
+    async def paced(page, number):
+        cuts = await controller.wait() if controller else None
+        return cuts, await action(page, number)
+
+    async def fetch(number):
+        path = os.path.join(directory, f"{number}.html")
+        if os.path.exists(path):
+            return
+        try:
+            cuts, html = await pool.run(partial(paced, number=number))
+        except Error as e:
+            counts["failed"] += 1
+            err_print(f"Failed to fetch oath {number}: {e}")
+            return
+        if page_is_invalid(html):
+            if controller and TIMED_OUT in html:
+                controller.timed_out(number, cuts)
+            counts["invalid"] += 1
+            err_print(f"Invalid page for oath {number}")
+            return
+        if controller:
+            controller.succeeded()
+        write_atomically(path, html)
+        counts["fetched"] += 1
+        err_print(f"Downloaded oath {number}")
+
+    await asyncio.gather(*(fetch(number) for number in numbers))
+    return counts["fetched"], counts["invalid"], counts["failed"]
+
+
+async def fetch_range(args):
+    content = search_form_content if args.form else url_content
+    action = partial(content, base_url=args.base_url)
+    controller = None
+    if not args.no_pacing:
+        controller = RateController(args.rate, max_rate=args.max_rate)
+    max_memory = args.max_memory * 1024 * 1024 if args.max_memory else None
+    async with BrowserPool(
+        args.size, args.max_uses, max_memory, args.browser, args.timeout
+    ) as pool:
+        fetched, invalid, failed = await fetch_pages(
+            pool,
+            range(args.start, args.end + 1),
+            args.directory,
+            action,
+            controller,
+        )
+        err_print(
+            f"{fetched} fetched, {invalid} invalid, {failed} failed; {pool.stats()}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Download oath pages START..END with a pool of browser pages, "
+        "for when the pages need a real browser (see fetch.py otherwise)"
+    )
+    parser.add_argument("start", type=int)
+    parser.add_argument("end", type=int)
+    parser.add_argument(
+        "-d", "--directory", default="oaths", help="where pages are saved"
+    )
+    parser.add_argument(
+        "-n",
+        "--size",
+        type=int,
+        default=4,
+        help="browser contexts, and so navigations in flight (default: 4)",
+    )
+    parser.add_argument(
+        "--max-uses",
+        type=int,
+        default=100,
+        help="navigations before a page's context is replaced (default: 100)",
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=float,
+        help="replace a page's context once its JavaScript heap passes this "
+        "many MB (chromium only)",
+    )
+    parser.add_argument(
+        "--browser", choices=("webkit", "chromium", "firefox"), default="webkit"
+    )
+    parser.add_argument(
+        "--form",
+        action="store_true",
+        help="find each oath through the search form instead of its URL",
+    )
+    parser.add_argument(
+        "--base-url",
+        default=BASE_URL,
+        help="database URL, e.g. a stand_in_server.py for testing",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=30, help="per-navigation timeout in seconds"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=1.0,
+        help="navigations per second to start at (default: 1)",
+    )
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        default=10.0,
+        help="fastest pace in navigations per second (default: 10)",
+    )
+    parser.add_argument("--no-pacing", action="store_true")
+    args = parser.parse_args(argv)
+    os.makedirs(args.directory, exist_ok=True)
+    try:
+        asyncio.run(fetch_range(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+from agent_registry import add_agent_table_argument, agent_records
+
+# the single-valued fields of an extracted oath, stored as columns of oaths
+OATH_COLUMNS = [
+    "author",
+    "title",
+    "reference",
+    "work_type",
+    "genre",
+    "work_date",
+    "date",
+    "reference_type",
+    "state",
+    "if_taken",
+    "if_refused",
+    "if_kept",
+    "if_broken",
+    "taken",
+    "impact",
+    "consequences_of_breach",
+    "statement",
+    "linguistic",
+    "remarks",
+]
+
+AGENT_ATTRIBUTES = ["gender", "age", "status", "origin"]
+
+# what the site gives for an agent or god: "n/a" when there is none, and
+# "unknown" when there is one but it is not named
+NOT_APPLICABLE = "n/a"
+UNKNOWN = "unknown"
+
+SCHEMA = f"""
+CREATE TABLE oaths (
+    oath_id INTEGER PRIMARY KEY,
+    {", ".join(f"{column} TEXT" for column in OATH_COLUMNS)}
+);
+CREATE TABLE agents (
+    agent_id INTEGER PRIMARY KEY,
+    name TEXT,  -- NULL for an unknown agent
+    {", ".join(f"{column} TEXT" for column in AGENT_ATTRIBUTES)}
+);
+CREATE TABLE oath_agents (
+    oath_id INTEGER NOT NULL REFERENCES oaths (oath_id),
+    agent_id INTEGER NOT NULL REFERENCES agents (agent_id),
+    role TEXT NOT NULL CHECK (role IN ('swearer', 'swearee', 'proposer')),
+    position INTEGER NOT NULL
+);
+CREATE TABLE gods (
+    god_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE oath_gods (
+    oath_id INTEGER NOT NULL REFERENCES oaths (oath_id),
+    god_id INTEGER REFERENCES gods (god_id),  -- NULL for an unknown god
+    position INTEGER NOT NULL
+);
+"""
+
+# created after the load, which is faster than maintaining them row by row
+INDEXES = """
+CREATE INDEX oaths_author ON oaths (author);
+CREATE INDEX oaths_genre ON oaths (genre);
+CREATE INDEX agents_name ON agents (name);
+CREATE INDEX agents_gender ON agents (gender);
+CREATE INDEX oath_agents_agent ON oath_agents (agent_id, role);
+CREATE INDEX oath_agents_oath ON oath_agents (oath_id, role);
+CREATE INDEX oath_gods_god ON oath_gods (god_id);
+CREATE INDEX oath_gods_oath ON oath_gods (oath_id);
+"""
+
+EXAMPLE_QUERY = """
+-- oaths sworn by Zeus where the swearer is female
+SELECT DISTINCT o.oath_id, o.author, o.title, o.reference
+FROM gods g
+JOIN oath_gods og ON og.god_id = g.god_id
+JOIN oath_agents oa ON oa.oath_id = og.oath_id AND oa.role = 'swearer'
+JOIN agents a ON a.agent_id = oa.agent_id AND a.gender = 'female'
+JOIN oaths o ON o.oath_id = og.oath_id
+WHERE g.name = 'Zeus';
+"""
+
+
+def applicable(names):
+    return [name for name in names if name != NOT_APPLICABLE]
+
+
+def known(name):
+    return None if name == UNKNOWN else name
+
+
+class SQLiteExporter:
+    """
+    Loads extracted oaths into the normalized schema above, in batches of
+    batch_size records. Agents are identified by name plus all their
+    attributes; proposers only have a name. An "n/a" agent or god is left
+    out, and an "unknown" one is linked with a NULL name or god_id, so
+    neither is counted as someone called that.
+    """
+
+    def __init__(self, db, batch_size=500):
+        self.db = db
+        self.batch_size = batch_size
+        self.agent_ids = {}
+        self.god_ids = {}
+        self.oaths = []
+        self.agents = []
+        self.oath_agents = []
+        self.gods = []
+        self.oath_gods = []
+
+    def agent_id(self, name, attributes):
+        key = (known(name), *attributes)
+        agent_id = self.agent_ids.get(key)
+        if agent_id is None:
+            agent_id = self.agent_ids[key] = len(self.agent_ids) + 1
+            self.agents.append((agent_id, *key))
+        return agent_id
+
+    def god_id(self, name):
+        name = known(name)
+        if name is None:
+            return None
+        god_id = self.god_ids.get(name)
+        if god_id is None:
+            god_id = self.god_ids[name] = len(self.god_ids) + 1
+            self.gods.append((god_id, name))
+        return god_id
+
+    def add(self, oath):
+        oath_id = oath["oath_id"]
+        self.oaths.append((oath_id, *(oath.get(column) for column in OATH_COLUMNS)))
+        for role in ("swearer", "swearee"):
+            agents = [a for a in oath.get(role, []) if a["agent"] != NOT_APPLICABLE]
+            for position, agent in enumerate(agents):
+                attributes = [agent.get(column) for column in AGENT_ATTRIBUTES]
+                agent_id = self.agent_id(agent["agent"], attributes)
+                self.oath_agents.append((oath_id, agent_id, role, position))
+        for position, name in enumerate(applicable(oath.get("proposed_by", []))):
+            agent_id = self.agent_id(name, [None] * len(AGENT_ATTRIBUTES))
+            self.oath_agents.append((oath_id, agent_id, "proposer", position))
+        for position, name in enumerate(applicable(oath.get("gods_invoked", []))):
+            self.oath_gods.append((oath_id, self.god_id(name), position))
+        if len(self.oaths) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        placeholders = ", ".join("?" * (len(OATH_COLUMNS) + 1))
+        self.db.executemany(f"INSERT INTO oaths VALUES ({placeholders})", self.oaths)
+        self.db.executemany("INSERT INTO agents VALUES (?, ?, ?, ?, ?, ?)", self.agents)
+        self.db.executemany(
+            "INSERT INTO oath_agents VALUES (?, ?, ?, ?)", self.oath_agents
+        )
+        self.db.executemany("INSERT INTO gods VALUES (?, ?)", self.gods)
+        self.db.executemany("INSERT INTO oath_gods VALUES (?, ?, ?)", self.oath_gods)
+        self.oaths = []
+        self.agents = []
+        self.oath_agents = []
+        self.gods = []
+        self.oath_gods = []
+
+
+def export(records, path, batch_size=500):
+    """
+    Write records (extracted oath dicts) to a new SQLite database at path,
+    in one transaction. The database is built next to path and renamed
+    into place, so readers never see a half-loaded file.
+    Returns the number of oaths written.
+    """
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    try:
+        exporter = SQLiteExporter(db, batch_size)
+        count = 0
+        with db:
+            db.executescript(SCHEMA)
+            for oath in records:
+                if not oath.get("oath_id"):
+                    continue
+                exporter.add(oath)
+                count += 1
+            exporter.flush()
+            db.executescript(INDEXES)
+        db.execute("ANALYZE")
+    finally:
+        db.close()
+    os.replace(tmp_path, path)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load extracted oaths (JSON lines on stdin) into a SQLite database",
+        epilog="example query:" + EXAMPLE_QUERY,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="oaths.db",
+        help="database to write (default: oaths.db)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="oaths per batch of inserts (default: 500)",
+    )
+    add_agent_table_argument(parser)
+    args = parser.parse_args(argv)
+    records = agent_records((json.loads(line) for line in sys.stdin), args, parser)
+    count = export(records, args.output, args.batch_size)
+    sys.stderr.write(f"Wrote {count} oaths to {args.output}\n")
+
+
+if __name__ == "__main__":
+    main()
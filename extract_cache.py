@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+from pages import page_exists, read_page_bytes
+
+
+class ExtractionCache:
+    """
+    On-disk cache of extracted features, keyed by the sha256 of the page
+    plus the extractor version, so unchanged pages are never parsed again.
+
+        cache = ExtractionCache("oaths.cache", EXTRACTOR_VERSION)
+        features = cache.lookup(path)  # None on a miss
+        ...
+        cache.store(path, features, seconds)
+        cache.close()
+    """
+
+    def __init__(self, path, version):
+        self.version = version
+        self.db = sqlite3.connect(path)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS extractions (
+                digest TEXT NOT NULL,
+                version TEXT NOT NULL,
+                features TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                PRIMARY KEY (digest, version)
+            );
+            CREATE TABLE IF NOT EXISTS sources (
+                path TEXT PRIMARY KEY,
+                digest TEXT NOT NULL
+            );
+            """
+        )
+        # digests of the files looked up this run, for store()
+        self.digests = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.seconds_saved = 0.0
+
+    def digest(self, path):
+        return hashlib.sha256(read_page_bytes(path)).hexdigest()
+
+    def lookup(self, path):
+        """
+        Return the cached features for the page at path, or None
+        """
+        path = os.path.abspath(path)
+        digest = self.digest(path)
+        self.digests[path] = digest
+        row = self.db.execute(
+            "SELECT features, seconds FROM extractions WHERE digest = ? AND version = ?",
+            (digest, self.version),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.seconds_saved += row[1]
+        self.db.execute(
+            "INSERT OR REPLACE INTO sources (path, digest) VALUES (?, ?)",
+            (path, digest),
+        )
+        return json.loads(row[0])
+
+    def store(self, path, features, seconds):
+        """
+        Remember the features extracted from path; it must have been looked up first
+        """
+        path = os.path.abspath(path)
+        digest = self.digests[path]
+        self.db.execute(
+            "INSERT OR REPLACE INTO extractions (digest, version, features, seconds) VALUES (?, ?, ?, ?)",
+            (digest, self.version, json.dumps(features), seconds),
+        )
+        self.db.execute(
+            "INSERT OR REPLACE INTO sources (path, digest) VALUES (?, ?)",
+            (path, digest),
+        )
+
+    def evict_missing(self):
+        """
+        Drop entries whose source file is gone, and entries from other
+        extractor versions
+        """
+        gone = [
+            (path,)
+            for (path,) in self.db.execute("SELECT path FROM sources")
+            if not page_exists(path)
+        ]
+        self.db.executemany("DELETE FROM sources WHERE path = ?", gone)
+        cursor = self.db.execute(
+            """
+            DELETE FROM extractions
+            WHERE version != ? OR digest NOT IN (SELECT digest FROM sources)
+            """,
+            (self.version,),
+        )
+        self.evicted += cursor.rowcount
+
+    def stats(self):
+        return (
+            f"cache: {self.hits} hits, {self.misses} misses, "
+            f"{self.evicted} evicted, {self.seconds_saved:.1f}s saved"
+        )
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
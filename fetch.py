@@ -0,0 +1,459 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pages import PageStore, build_dictionary, read_page_bytes
+from transform import err_print, example_html
+
+BASE_URL = "https://www.nottingham.ac.uk/~brzoaths/database/"
+
+# the rest of the query string the site's own result links use
+SEARCH_QUERY = "referenceTypeID=&authorIDName=&workID=0&workCategory=&workGenre=&takenStateID=0&Fictional=U&markerID=&sanctifyingCircumstances=N&oathDate=&invokedGodID=0&swearerID=0&sweareeID=0&swearerStateID=0&sweareeStateID=0&swearerStatus=&sweareeStatus=&swearerAgeClass=&sweareeAgeClass=&swearerGenderID=&sweareeGenderID=&centuryID=0&Taken=U&Fulfilled=U"
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/104.0.5112.79 Safari/537.36",
+}
+
+
+def page_url(number, base_url=BASE_URL):
+    return f"{base_url}oath_reference_details.php?oathID={number}&{SEARCH_QUERY}"
+
+
+TIMED_OUT = "You have been timed out"
+
+
+def page_is_invalid(html):
+    return "Error - unable to retrieve work" in html or TIMED_OUT in html
+
+
+class RateController:
+    """
+    Paces request starts to self.rate per second and adapts the rate AIMD
+    style: every valid page adds increase (up to max_rate), and a "timed
+    out" page multiplies it by decrease (down to min_rate), once per
+    congestion event: the other requests already sent when the rate was
+    cut time out with it and are not cut for again. Pacing decisions are
+    logged: every cut, and each rise of a quarter or more.
+    """
+
+    def __init__(
+        self, rate=2.0, min_rate=0.05, max_rate=20.0, increase=0.1, decrease=0.5
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.next_start = 0.0
+        self.logged_rate = rate
+        self.timeouts = 0
+        self.cuts = 0
+
+    async def wait(self):
+        """
+        Sleep until this request's turn; turns are 1 / rate apart. Returns
+        the number of cuts so far, to pass to timed_out.
+        """
+        cuts = self.cuts
+        now = asyncio.get_running_loop().time()
+        start = max(now, self.next_start)
+        self.next_start = start + 1 / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
+        return cuts
+
+    def succeeded(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+        if self.rate >= self.logged_rate * 1.25:
+            err_print(f"Pacing up to {self.rate:.2f} requests/s")
+            self.logged_rate = self.rate
+
+    def timed_out(self, number, cuts):
+        """
+        Cut the rate for oath number's timed-out page, unless its turn was
+        granted (wait returned cuts) before the last cut
+        """
+        self.timeouts += 1
+        if cuts != self.cuts:
+            return
+        self.cuts += 1
+        previous = self.rate
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        # requests already given turns at the old rate wait a new gap too
+        now = asyncio.get_running_loop().time()
+        self.next_start = max(self.next_start, now) + 1 / self.rate
+        err_print(
+            f"Timed out on oath {number}: pacing down from {previous:.2f} "
+            f"to {self.rate:.2f} requests/s"
+        )
+        self.logged_rate = self.rate
+
+
+def write_atomically(path, text):
+    """
+    Write text to path through a temporary file in the same directory,
+    so a crash never leaves a partial page behind
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", prefix=".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class Manifest:
+    """
+    What the crawler knows about each page it saved, by oath id: when it
+    was last fetched or revalidated, the sha256 of its body, and the ETag
+    and Last-Modified headers the server sent with it. Kept as JSON.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def get(self, number):
+        return self.entries.get(str(number))
+
+    def conditional_headers(self, number):
+        """
+        The headers that ask the server for the page only if it changed
+        """
+        entry = self.get(number) or {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def record(self, number, digest, response_headers):
+        self.entries[str(number)] = {
+            "fetched_at": time.time(),
+            "sha256": digest,
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+        }
+
+    def touch(self, number):
+        self.entries[str(number)]["fetched_at"] = time.time()
+
+    def save(self):
+        write_atomically(self.path, json.dumps(self.entries, indent=1, sort_keys=True))
+
+
+class Fetcher:
+    """
+    Fetches oath pages straight from oath_reference_details.php, at most
+    concurrency at a time, over one pooled keep-alive HTTP session.
+    Pages already saved are skipped. Pages are saved as files in directory
+    or, given store, appended to that page store (created if missing, with
+    the example page as its dictionary).
+
+    With a manifest (see Manifest), refresh re-requests saved pages
+    conditionally; a page is rewritten only if its body changed, and the
+    oath ids of new and rewritten pages are collected in self.changed.
+
+    With a controller (a RateController) requests are paced by it, and
+    invalid pages are retried up to retries times after a random delay of
+    up to retry_delay * 2 ** attempt seconds.
+    """
+
+    def __init__(
+        self,
+        directory="oaths",
+        base_url=BASE_URL,
+        concurrency=4,
+        timeout=30,
+        store=None,
+        manifest=None,
+        refresh=False,
+        controller=None,
+        retries=3,
+        retry_delay=1.0,
+    ):
+        self.directory = directory
+        self.controller = controller
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.manifest = manifest
+        self.refresh = refresh
+        self.store = None
+        if store:
+            if os.path.exists(store):
+                self.store = PageStore(store)
+            else:
+                dictionary = build_dictionary([example_html.encode()])
+                self.store = PageStore.create(store, dictionary)
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # requests is blocking, so each request runs on one of these threads
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.fetched = 0
+        self.skipped = 0
+        self.unchanged = 0
+        self.invalid = 0
+        self.failed = 0
+        self.retried = 0
+        self.changed = []
+
+    def path(self, number):
+        return os.path.join(self.directory, f"{number}.html")
+
+    def has_page(self, number):
+        if self.store:
+            return f"{number}.html" in self.store
+        return os.path.exists(self.path(number))
+
+    def page_digest(self, number):
+        """
+        The sha256 of the saved page, from the manifest if it has it
+        """
+        entry = self.manifest and self.manifest.get(number)
+        if entry:
+            return entry["sha256"]
+        if self.store:
+            data = self.store.page_bytes(f"{number}.html")
+        else:
+            data = read_page_bytes(self.path(number))
+        return hashlib.sha256(data).hexdigest()
+
+    def save_page(self, number, html):
+        if self.store:
+            self.store.add(f"{number}.html", html.encode())
+        else:
+            write_atomically(self.path(number), html)
+
+    def get(self, number, headers=None):
+        response = self.session.get(
+            page_url(number, self.base_url), headers=headers, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response
+
+    async def fetch(self, number, semaphore):
+        saved = self.has_page(number)
+        if saved and not self.refresh:
+            self.skipped += 1
+            return
+        headers = None
+        if saved and self.manifest:
+            headers = self.manifest.conditional_headers(number)
+        for attempt in range(self.retries + 1):
+            response, cuts = await self.request(number, headers, semaphore)
+            if response is None:
+                return
+            if response.status_code == 304:
+                self.unchanged += 1
+                self.manifest.touch(number)
+                return
+            html = response.text
+            if not page_is_invalid(html):
+                if self.controller:
+                    self.controller.succeeded()
+                break
+            if self.controller and TIMED_OUT in html:
+                self.controller.timed_out(number, cuts)
+            if attempt == self.retries or not self.controller:
+                self.invalid += 1
+                err_print(f"Invalid page for oath {number}")
+                return
+            self.retried += 1
+            delay = random.uniform(0, self.retry_delay * 2**attempt)
+            err_print(f"Invalid page for oath {number}; retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        digest = hashlib.sha256(html.encode()).hexdigest()
+        if saved and digest == self.page_digest(number):
+            self.unchanged += 1
+        else:
+            self.save_page(number, html)
+            self.fetched += 1
+            self.changed.append(number)
+            err_print(f"{'Updated' if saved else 'Downloaded'} oath {number}")
+        if self.manifest:
+            self.manifest.record(number, digest, response.headers)
+
+    async def request(self, number, headers, semaphore):
+        """
+        (response for oath number, or None if the request failed, the cut
+        count the controller's wait returned, or None without a controller)
+        """
+        async with semaphore:
+            cuts = await self.controller.wait() if self.controller else None
+            loop = asyncio.get_running_loop()
+            try:
+                response = await loop.run_in_executor(
+                    self.executor, self.get, number, headers
+                )
+            except requests.RequestException as e:
+                self.failed += 1
+                err_print(f"Failed to fetch oath {number}: {e}")
+                return None, cuts
+            return response, cuts
+
+    async def fetch_range(self, start, end):
+        if not self.store:
+            os.makedirs(self.directory, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(
+            *(self.fetch(number, semaphore) for number in range(start, end + 1))
+        )
+
+    def stats(self):
+        stats = (
+            f"{self.fetched} fetched, {self.skipped} already saved, "
+            f"{self.unchanged} unchanged, {self.invalid} invalid, {self.failed} failed, "
+            f"{self.retried} retried"
+        )
+        if self.controller:
+            stats += (
+                f"; {self.controller.timeouts} timed out, "
+                f"final rate {self.controller.rate:.2f} requests/s"
+            )
+        return stats
+
+    def close(self):
+        self.executor.shutdown()
+        self.session.close()
+        if self.store:
+            self.store.close()
+        if self.manifest:
+            self.manifest.save()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Download oath pages START..END into a directory"
+    )
+    parser.add_argument("start", type=int)
+    parser.add_argument("end", type=int)
+    parser.add_argument(
+        "-d", "--directory", default="oaths", help="where pages are saved"
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=4,
+        help="most requests in flight at once (default: 4)",
+    )
+    parser.add_argument(
+        "--store",
+        help="append pages to this compressed page store instead of "
+        "saving them to --directory",
+    )
+    parser.add_argument(
+        "--base-url",
+        default=BASE_URL,
+        help="database URL, e.g. a stand_in_server.py for testing",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=30, help="per-request timeout in seconds"
+    )
+    parser.add_argument(
+        "--manifest",
+        default="crawl_manifest.json",
+        help="record each page's fetch time, hash, ETag and Last-Modified here "
+        "(default: crawl_manifest.json)",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="revalidate pages already saved with conditional requests, "
+        "rewriting only those whose body changed",
+    )
+    parser.add_argument(
+        "--changed",
+        metavar="FILE",
+        help="write the oath ids of new and changed pages here, one per line "
+        "(for transform.py --ids)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=2.0,
+        help="requests per second to start at; it rises while pages come back "
+        "valid and halves on each timed-out page (default: 2)",
+    )
+    parser.add_argument(
+        "--min-rate",
+        type=float,
+        default=0.05,
+        help="slowest pace in requests per second (default: 0.05)",
+    )
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        default=20.0,
+        help="fastest pace in requests per second (default: 20)",
+    )
+    parser.add_argument(
+        "--no-pacing",
+        action="store_true",
+        help="send requests as fast as --concurrency allows, without retries",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="times to retry an invalid page (default: 3)",
+    )
+    parser.add_argument(
+        "--retry-delay",
+        type=float,
+        default=1.0,
+        help="base of the random exponential retry delay in seconds (default: 1)",
+    )
+    args = parser.parse_args(argv)
+    controller = None
+    if not args.no_pacing:
+        controller = RateController(args.rate, args.min_rate, args.max_rate)
+    fetcher = Fetcher(
+        args.directory,
+        args.base_url,
+        args.concurrency,
+        args.timeout,
+        args.store,
+        Manifest(args.manifest),
+        args.refresh,
+        controller,
+        args.retries,
+        args.retry_delay,
+    )
+    try:
+        asyncio.run(fetcher.fetch_range(args.start, args.end))
+    finally:
+        fetcher.close()
+        if args.changed:
+            write_atomically(
+                args.changed,
+                "".join(f"{number}\n" for number in sorted(fetcher.changed)),
+            )
+    err_print(fetcher.stats())
+
+
+if __name__ == "__main__":
+    main()
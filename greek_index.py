@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import unicodedata
+from array import array
+
+from text_index import oath_label
+
+# the fields of an extracted oath holding Greek (statement) and its
+# transliteration (linguistic)
+GREEK_FIELDS = ["statement", "linguistic"]
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def normalize(text):
+    """
+    Fold text for accent-insensitive matching: decompose (NFD), drop the
+    diacritics (accents, breathings, iota subscripts), casefold (which also
+    turns final sigma into σ) and keep only the words, each preceded by a
+    space. "νὴ Δί’" -> " νη δι"
+    """
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    folded = stripped.casefold().replace("ς", "σ")
+    return "".join(" " + word for word in WORD_PATTERN.findall(folded))
+
+
+def trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def build_index(records, path):
+    """
+    Write a trigram index of the GREEK_FIELDS of records to a new SQLite
+    file at path: each trigram of the normalized text maps to the sorted
+    oath ids containing it, and the normalized texts are kept to confirm
+    matches. Returns the number of oaths.
+    """
+    postings = {}
+    texts = []
+    labels = []
+    for oath in records:
+        oath_id = oath.get("oath_id")
+        if not oath_id:
+            continue
+        for field in GREEK_FIELDS:
+            text = normalize(oath.get(field) or "")
+            if text:
+                texts.append((oath_id, field, text))
+                for trigram in trigrams(text):
+                    postings.setdefault(trigram, set()).add(oath_id)
+        labels.append((oath_id, oath_label(oath)))
+
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    with db:
+        db.executescript(
+            """
+            CREATE TABLE trigrams (trigram TEXT PRIMARY KEY, oath_ids BLOB NOT NULL);
+            CREATE TABLE texts (oath_id INTEGER, field TEXT, text TEXT,
+                                PRIMARY KEY (oath_id, field));
+            CREATE TABLE docs (oath_id INTEGER PRIMARY KEY, label TEXT);
+            """
+        )
+        db.executemany("INSERT INTO texts VALUES (?, ?, ?)", texts)
+        db.executemany("INSERT INTO docs VALUES (?, ?)", labels)
+        db.executemany(
+            "INSERT INTO trigrams VALUES (?, ?)",
+            (
+                (trigram, array("I", sorted(oath_ids)).tobytes())
+                for trigram, oath_ids in postings.items()
+            ),
+        )
+    db.close()
+    os.replace(tmp_path, path)
+    return len(labels)
+
+
+class GreekIndex:
+    """
+    Reads an index written by build_index. A query is normalized like the
+    text, its trigrams narrow the search to the oaths containing all of
+    them, and only those oaths' texts are checked.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+
+    def postings(self, trigram):
+        row = self.db.execute(
+            "SELECT oath_ids FROM trigrams WHERE trigram = ?", (trigram,)
+        ).fetchone()
+        return set(array("I", row[0])) if row else set()
+
+    def candidates(self, needle):
+        """
+        The oath ids that may contain needle, or None if it is too short
+        to narrow the search
+        """
+        grams = trigrams(needle)
+        if not grams:
+            return None
+        result = None
+        for trigram in grams:
+            oath_ids = self.postings(trigram)
+            result = oath_ids if result is None else result & oath_ids
+            if not result:
+                break
+        return result
+
+    def search(self, query, prefix=False):
+        """
+        [(oath_id, field)] whose text contains query, ignoring accents,
+        breathings and case; with prefix, query must start a word
+        """
+        needle = normalize(query)
+        if not needle:
+            return []
+        if not prefix:
+            # the space that normalize puts before each word
+            needle = needle[1:]
+        oath_ids = self.candidates(needle)
+        if oath_ids is None:
+            rows = self.db.execute("SELECT oath_id, field, text FROM texts")
+        else:
+            ids = sorted(oath_ids)
+            rows = self.db.execute(
+                "SELECT oath_id, field, text FROM texts WHERE oath_id IN "
+                "(SELECT value FROM json_each(?))",
+                (json.dumps(ids),),
+            )
+        return sorted(
+            (oath_id, field) for oath_id, field, text in rows if needle in text
+        )
+
+    def label(self, oath_id):
+        return self.db.execute(
+            "SELECT label FROM docs WHERE oath_id = ?", (oath_id,)
+        ).fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Accent-insensitive trigram index over the Greek statement "
+        "and its transliteration"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser(
+        "build", help="index extracted oaths (JSON lines on stdin)"
+    )
+    build.add_argument("-o", "--output", default="greek.idx")
+    query = commands.add_parser(
+        "query",
+        help="find oaths whose statement or linguistic field contains the "
+        "query, ignoring accents, breathings and case",
+    )
+    query.add_argument("query")
+    query.add_argument("-i", "--index", default="greek.idx")
+    query.add_argument(
+        "--prefix", action="store_true", help="match only at the start of a word"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        records = (json.loads(line) for line in sys.stdin)
+        count = build_index(records, args.output)
+        sys.stderr.write(f"Indexed {count} oaths in {args.output}\n")
+        return
+
+    index = GreekIndex(args.index)
+    for oath_id, field in index.search(args.query, args.prefix):
+        print(f"{oath_id}\t{field}\t{index.label(oath_id)}")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
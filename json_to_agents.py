@@ -1,7 +1,10 @@
-import json
+import argparse
 import sys
 import csv
 
+from agent_registry import AgentRegistry, add_agent_table_argument, agent_records
+from records import read_input
+
 
 def convert_to_csv(data, csv_file_path):
     if not data:
@@ -17,32 +20,63 @@ def convert_to_csv(data, csv_file_path):
             writer.writerow(row)
 
 
-def unique_dicts_by_key(dicts, key):
-    seen = set()
-    unique_dicts = []
+def iter_unique_dicts_by_key(dicts, key, seen=None):
+    """
+    Yield the dicts whose key value has not been seen before; pass the
+    same seen set to keep deduplicating across calls
+    """
+    if seen is None:
+        seen = set()
     for d in dicts:
         value = d[key]
         if value not in seen:
             seen.add(value)
-            unique_dicts.append(d)
-    return unique_dicts
+            yield d
+
+
+def unique_dicts_by_key(dicts, key):
+    return list(iter_unique_dicts_by_key(dicts, key))
 
 
-agents = []
-for line in sys.stdin:
-    # read the line as JSON
-    oath = json.loads(line)
+def oath_agents(oath):
+    """
+    The swearers followed by the swearees of an oath
+    """
     oath_id = oath.get("oath_id", None)
-    if not oath_id:
-        continue
     swearers = oath.get("swearer", [])
     swearees = oath.get("swearee", [])
     if not swearers:
         sys.stderr.write(f"No swearers in {oath_id}\n")
     if not swearees:
         sys.stderr.write(f"No swearees in {oath_id}\n")
-    agents.extend(swearers)
-    agents.extend(swearees)
+    return swearers + swearees
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Write the distinct agents of extracted oaths (on stdin) to agents.csv"
+    )
+    parser.add_argument(
+        "--format",
+        choices=("json", "binary"),
+        default="json",
+        help="read JSON lines, or the binary record format of transform.py --format binary",
+    )
+    add_agent_table_argument(parser)
+    args = parser.parse_args(argv)
+    # only distinct agents are kept, not every swearer and swearee
+    registry = AgentRegistry()
+    records = read_input(sys.stdin.buffer, args.format)
+    for oath in agent_records(records, args, parser):
+        oath_id = oath.get("oath_id", None)
+        if not oath_id:
+            continue
+        for agent in oath_agents(oath):
+            registry.intern(agent)
+
+    registry.report_conflicts()
+    convert_to_csv(registry.first_by_name(), "agents.csv")
+
 
-uniq_agents = unique_dicts_by_key(agents, "agent")
-convert_to_csv(uniq_agents, "agents.csv")
+if __name__ == "__main__":
+    main()
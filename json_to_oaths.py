@@ -1,6 +1,12 @@
+import argparse
 import json
+import os
 import sys
 import csv
+import tempfile
+
+from agent_registry import add_agent_table_argument, agent_records
+from records import read_input
 
 
 def normalize_dict(d):
@@ -17,34 +23,153 @@ def normalize_dict(d):
             result["gods_invoked"] = "; ".join(v)
         elif k == "proposed_by":
             result["proposed_by"] = "; ".join(v)
+        elif k == "related_oaths":
+            result["related_oaths"] = "; ".join(map(str, v))
         else:
             result[k] = v
 
     return result
 
 
-def convert_to_csv(data, csv_file_path):
-    if not data:
-        return
+class StreamingCSVWriter:
+    """
+    Write dict rows to a CSV file as they arrive, without holding them.
+
+    With fieldnames (a declared schema) rows go straight to the file; keys
+    outside the schema are reported once and dropped, or with
+    extras="spill", start a spill from that row on. Without, every row is
+    spilled to a temporary file while the columns are discovered in
+    first-seen order. A spill is written out on close(), after the rows
+    already in the file, under a header that covers every column.
+    """
+
+    def __init__(self, path, fieldnames=None, buffer_size=1 << 20, extras="drop"):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.extras = extras
+        self.rows = 0
+        self.dropped = set()
+        # a dict rather than a set, to keep first-seen column order
+        self.columns = dict.fromkeys(fieldnames or ())
+        self.file = None
+        self.spill = None
+        if self.columns:
+            # held open across writerow() calls and closed by close()
+            self.file = open(path, "w", newline="", buffering=buffer_size)  # noqa: SIM115
+            self.writer = csv.DictWriter(
+                self.file, fieldnames=list(self.columns), extrasaction="ignore"
+            )
+            self.writer.writeheader()
+        else:
+            self.start_spill()
+
+    def start_spill(self):
+        # held open across writerow() calls and closed by close()
+        self.spill = tempfile.TemporaryFile("w+", buffering=self.buffer_size)  # noqa: SIM115
+
+    def writerow(self, row):
+        self.rows += 1
+        if (
+            self.spill is None
+            and self.extras == "spill"
+            and any(key not in self.columns for key in row)
+        ):
+            self.start_spill()
+        if self.spill is None:
+            for key in row:
+                if key not in self.columns and key not in self.dropped:
+                    self.dropped.add(key)
+                    sys.stderr.write(
+                        f"Column {key} is not in the schema; dropping it\n"
+                    )
+            self.writer.writerow(row)
+        else:
+            for key in row:
+                self.columns.setdefault(key)
+            self.spill.write(json.dumps(row))
+            self.spill.write("\n")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        if self.spill is None:
+            return
+        if self.file is None:
+            if self.rows:
+                self.write_spill(self.path, ())
+        else:
+            # copy the rows written before the spill began under the new header
+            temporary = self.path + ".tmp"
+            with open(self.path, newline="") as written:
+                rows = csv.reader(written)
+                next(rows)
+                self.write_spill(temporary, rows)
+            os.replace(temporary, self.path)
+        self.spill.close()
+
+    def write_spill(self, path, written):
+        """
+        Write the CSV at path: the header, the rows of written (lists of
+        cells, in the order of the columns they were written under), then
+        the spilled rows
+        """
+        self.spill.seek(0)
+        with open(path, "w", newline="", buffering=self.buffer_size) as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=list(self.columns))
+            writer.writeheader()
+            padding = [""] * len(self.columns)
+            copy = csv.writer(csvfile)
+            for row in written:
+                copy.writerow(row + padding[len(row) :])
+            for line in self.spill:
+                writer.writerow(json.loads(line))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
-    # Extract headers from the first dictionary
-    headers = data[0].keys()
 
-    with open(csv_file_path, "w", newline="") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=headers)
-        writer.writeheader()
-        for row in data:
-            writer.writerow(row)
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert extracted oaths (JSON lines on stdin) to a CSV file"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="oaths.csv",
+        help="CSV file to write (default: oaths.csv)",
+    )
+    parser.add_argument(
+        "--schema",
+        metavar="COLUMNS",
+        help="comma-separated columns to write; rows are written as they arrive "
+        "(default: discover the columns from the data via a spill file)",
+    )
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=1 << 20,
+        help="write buffer size in bytes (default: 1 MiB)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("json", "binary"),
+        default="json",
+        help="read JSON lines, or the binary record format of transform.py --format binary",
+    )
+    add_agent_table_argument(parser)
+    args = parser.parse_args(argv)
+    fieldnames = [c.strip() for c in args.schema.split(",")] if args.schema else None
 
+    # read stdin one by one, writing each normalized oath as it arrives
+    with StreamingCSVWriter(args.output, fieldnames, args.buffer_size) as writer:
+        records = read_input(sys.stdin.buffer, args.format)
+        for oath in agent_records(records, args, parser):
+            # normalize the dictionary
+            writer.writerow(normalize_dict(oath))
 
-# read stdin one by one
-oaths = []
-for line in sys.stdin:
-    # read the line as JSON
-    oath = json.loads(line)
-    # normalize the dictionary
-    normalized_oath = normalize_dict(oath)
-    oaths.append(normalized_oath)
 
-# write the normalized oaths to stdout
-convert_to_csv(oaths, "oaths.csv")
+if __name__ == "__main__":
+    main()
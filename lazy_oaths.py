@@ -0,0 +1,273 @@
+import argparse
+import html
+import json
+import os
+import re
+import sys
+
+from pages import is_page_source, oath_files, read_page
+from transform import (
+    CONTENT_PATTERN,
+    DERIVED_FIELDS,
+    FIELD_PLAN,
+    FIELD_SPECS,
+    H2_KEYS,
+    PARSERS,
+    RECORD_KEYS,
+    TITLE_PATTERN,
+    err_print,
+    feature_name_from_label,
+    filter_to_features,
+    handle_h2,
+    installed_parser,
+    parse_page,
+    table_rows,
+    text_value,
+)
+
+H2_PATTERN = re.compile(r"<h2\b.*?</h2>", re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r"<[^>]*>")
+
+# the table row fields by key, and the derived fields by key (see transform.py)
+ROW_LABELS = {key: label for label, _, key in FIELD_SPECS}
+DERIVED_SOURCES = {
+    derived_key: (key, derive) for key, (derived_key, derive) in DERIVED_FIELDS.items()
+}
+FIELD_KEYS = RECORD_KEYS
+
+
+def page_oath_id(text):
+    """
+    The oath id in a page's <title> ("Oath 2595 results - ..."), read
+    without parsing the page; None if it has none (e.g. the search form)
+    """
+    match = TITLE_PATTERN.search(text)
+    if not match:
+        return None
+    words = html.unescape(TAG_PATTERN.sub("", match.group(0))).split()
+    if len(words) < 2 or not words[1].isdigit():
+        return None
+    return int(words[1])
+
+
+class OathRecord:
+    """
+    An oath page whose fields are extracted the first time each is read,
+    then kept in the record's slot. record.genre parses only the page's
+    h2, record.swearer the whole page but only the swearer rows of its
+    table; fields never read are never extracted. A field the page does
+    not have reads as None. to_dict() is what transform.py extracts.
+    """
+
+    __slots__ = FIELD_KEYS + (
+        "path",
+        "_text",
+        "_parser",
+        "_content_only",
+        "_soup",
+        "_h2",
+        "_cells",
+        "_extra",
+    )
+
+    def __init__(self, path, text, oath_id, parser="html.parser", content_only=False):
+        self.path = path
+        self.oath_id = oath_id
+        self._text = text
+        self._parser = parser
+        self._content_only = content_only
+        self._soup = None
+        self._h2 = None
+        self._cells = None
+        self._extra = {}
+
+    def __getattr__(self, name):
+        # only reached for a field whose slot is not filled yet
+        if name not in FIELD_KEYS:
+            raise AttributeError(
+                f"{type(self).__name__!r} object has no attribute {name!r}"
+            )
+        value = self.extract(name)
+        setattr(self, name, value)
+        return value
+
+    def __repr__(self):
+        return f"<OathRecord {self.oath_id} {self.path}>"
+
+    def soup(self):
+        if self._soup is None:
+            self._soup = parse_page(self._text, self._parser, self._content_only)
+        return self._soup
+
+    def h2_element(self):
+        """
+        The page's "#content h2", parsed on its own unless the page is
+        """
+        if self._soup is None:
+            title = TITLE_PATTERN.search(self._text)
+            content = title and CONTENT_PATTERN.search(self._text, title.end())
+            if content:
+                match = H2_PATTERN.search(self._text, content.start())
+                if not match:
+                    return None
+                return parse_page(match.group(0), self._parser).h2
+        return self.soup().select_one("#content h2")
+
+    def h2(self):
+        """
+        {key: value} of the fields in the page's h2
+        """
+        if self._h2 is None:
+            element = self.h2_element()
+            self._h2 = dict(handle_h2(element)) if element else {}
+        return self._h2
+
+    def cells(self):
+        """
+        {key: (value extractor, value td)} of the page's table rows, in
+        page order
+        """
+        if self._cells is None:
+            self._cells = {}
+            for label, td in filter_to_features(table_rows(self.soup())):
+                field = FIELD_PLAN.get(label)
+                if field:
+                    key, extract_value = field
+                else:
+                    key = feature_name_from_label(label)
+                    err_print("No handler for", key)
+                    extract_value = text_value
+                self._cells[key] = (extract_value, td)
+        return self._cells
+
+    def extract(self, key):
+        if key in DERIVED_SOURCES:
+            source, derive = DERIVED_SOURCES[key]
+            value = self.get(source)
+            return None if value is None else derive(value)
+        if key in H2_KEYS:
+            # a table row of the same name wins, as in transform.py; a page
+            # without the row's label anywhere cannot have the row
+            label = ROW_LABELS.get(key)
+            if label is None or label not in self._text or key not in self.cells():
+                return self.h2().get(key)
+        cell = self.cells().get(key)
+        if cell is None:
+            return None
+        extract_value, td = cell
+        return extract_value(key, td)
+
+    def get(self, key, default=None):
+        """
+        The value of any field, including those transform.py has no
+        handler for, or default if the page does not have it
+        """
+        if key in FIELD_KEYS:
+            value = getattr(self, key)
+        elif key in self._extra:
+            value = self._extra[key]
+        else:
+            value = self._extra[key] = self.extract(key)
+        return default if value is None else value
+
+    def to_dict(self):
+        """
+        Every field, keyed and ordered as transform.py extracts them
+        """
+        features = {"oath_id": self.oath_id}
+        for key in self.h2():
+            features[key] = self.get(key)
+        for key in self.cells():
+            features[key] = self.get(key)
+            derived = DERIVED_FIELDS.get(key)
+            if derived:
+                features[derived[0]] = self.get(derived[0])
+        return features
+
+
+def iter_oaths(path, parser="html.parser", content_only=False):
+    """
+    Yield an OathRecord for each oath page at path (a directory, archive,
+    page store or single page) in oath id order, reading one page at a
+    time; pages without an oath id, like the search form, are skipped
+
+        for oath in iter_oaths("oaths"):
+            if oath.genre == "Comic.":
+                print(oath.author, oath.gods_invoked)
+    """
+    if is_page_source(path):
+        paths = (os.path.join(path, file) for file in oath_files(path))
+    else:
+        paths = [path]
+    for page_path in paths:
+        text = read_page(page_path)
+        oath_id = page_oath_id(text)
+        if oath_id is not None:
+            yield OathRecord(page_path, text, oath_id, parser, content_only)
+
+
+def matches(oath, conditions):
+    """
+    Whether each (key, value) of conditions is the oath's value of key,
+    or one of its values for a list field
+    """
+    for key, value in conditions:
+        actual = oath.get(key)
+        if isinstance(actual, list):
+            if value not in map(str, actual):
+                return False
+        elif actual is None or str(actual) != value:
+            return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Filter oath pages, extracting only the fields that are "
+        "tested or printed (JSON lines on stdout)"
+    )
+    parser.add_argument(
+        "source", nargs="?", default="oaths", help="directory, archive or store"
+    )
+    parser.add_argument(
+        "-w",
+        "--where",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="keep oaths whose KEY is VALUE (or includes it, for a list); "
+        "may be repeated",
+    )
+    parser.add_argument(
+        "-f", "--fields", help="comma separated fields to print (default: all)"
+    )
+    parser.add_argument(
+        "--parser", type=installed_parser, choices=PARSERS, default="html.parser"
+    )
+    parser.add_argument(
+        "--content-only",
+        action="store_true",
+        help="parse only the title and #content div of each page",
+    )
+    args = parser.parse_args(argv)
+    conditions = []
+    for condition in args.where:
+        key, equals, value = condition.partition("=")
+        if not equals:
+            parser.error(f"--where {condition!r} is not KEY=VALUE")
+        conditions.append((key, value))
+    fields = args.fields.split(",") if args.fields else None
+
+    for oath in iter_oaths(args.source, args.parser, args.content_only):
+        if not matches(oath, conditions):
+            continue
+        if fields:
+            record = {field: oath.get(field) for field in fields}
+        else:
+            record = oath.to_dict()
+        sys.stdout.write(json.dumps(record))
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
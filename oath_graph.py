@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+from text_index import oath_label
+
+
+def oath_links(records):
+    """
+    Yield (oath_id, referenced oath_id) for the related_oaths of each
+    record, leaving out an oath's references to itself
+    """
+    for oath in records:
+        oath_id = oath.get("oath_id")
+        if not oath_id:
+            continue
+        for target in oath.get("related_oaths", []):
+            if target != oath_id:
+                yield oath_id, target
+
+
+def connected_components(nodes, links):
+    """
+    {oath_id: component id} treating links as undirected; a component's id
+    is its smallest oath id
+    """
+    parent = {node: node for node in nodes}
+
+    def find(node):
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for source, target in links:
+        first, second = find(source), find(target)
+        if first != second:
+            parent[max(first, second)] = min(first, second)
+    return {node: find(node) for node in parent}
+
+
+def build_graph(records, path):
+    """
+    Write the cross-reference graph of records to a new SQLite file at
+    path: the links in both directions, each oath's connected component
+    and the oath labels. Returns (oaths, links).
+    """
+    labels = {}
+    links = set()
+    for oath in records:
+        if oath.get("oath_id"):
+            labels[oath["oath_id"]] = oath_label(oath)
+            links.update(oath_links([oath]))
+    nodes = set(labels).union(*links) if links else set(labels)
+    components = connected_components(sorted(nodes), sorted(links))
+
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    with db:
+        db.executescript(
+            """
+            CREATE TABLE links (source INTEGER, target INTEGER,
+                                PRIMARY KEY (source, target)) WITHOUT ROWID;
+            CREATE TABLE oaths (oath_id INTEGER PRIMARY KEY, component INTEGER,
+                                label TEXT);
+            """
+        )
+        db.executemany("INSERT INTO links VALUES (?, ?)", sorted(links))
+        db.executemany(
+            "INSERT INTO oaths VALUES (?, ?, ?)",
+            ((node, components[node], labels.get(node)) for node in sorted(components)),
+        )
+        db.executescript(
+            """
+            CREATE INDEX links_target ON links (target, source);
+            CREATE INDEX oaths_component ON oaths (component);
+            """
+        )
+    db.close()
+    os.replace(tmp_path, path)
+    return len(labels), len(links)
+
+
+class OathGraph:
+    """
+    Reads a graph written by build_graph; the adjacency lists are loaded
+    into memory once, so neighbourhood queries never go back to disk
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.forward = {}
+        self.backward = {}
+        for source, target in self.db.execute("SELECT source, target FROM links"):
+            self.forward.setdefault(source, []).append(target)
+            self.backward.setdefault(target, []).append(source)
+
+    def references(self, oath_id):
+        """
+        The oaths oath_id refers to
+        """
+        return self.forward.get(oath_id, [])
+
+    def referenced_by(self, oath_id):
+        """
+        The oaths that refer to oath_id
+        """
+        return self.backward.get(oath_id, [])
+
+    def neighbourhood(self, oath_id, depth=1):
+        """
+        {oath_id: distance} of the oaths within depth links of oath_id,
+        following links in either direction
+        """
+        distances = {oath_id: 0}
+        frontier = [oath_id]
+        for distance in range(1, depth + 1):
+            next_frontier = []
+            for node in frontier:
+                for neighbour in self.references(node) + self.referenced_by(node):
+                    if neighbour not in distances:
+                        distances[neighbour] = distance
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+        return distances
+
+    def component(self, oath_id):
+        """
+        The sorted oath ids connected to oath_id by links in either direction
+        """
+        return [
+            node
+            for (node,) in self.db.execute(
+                "SELECT oath_id FROM oaths WHERE component = "
+                "(SELECT component FROM oaths WHERE oath_id = ?) ORDER BY oath_id",
+                (oath_id,),
+            )
+        ]
+
+    def largest_components(self, limit=10):
+        """
+        [(size, component id)] of the largest components, largest first
+        """
+        return self.db.execute(
+            "SELECT COUNT(*) AS size, component FROM oaths GROUP BY component "
+            "ORDER BY size DESC, component LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+    def label(self, oath_id):
+        row = self.db.execute(
+            "SELECT label FROM oaths WHERE oath_id = ?", (oath_id,)
+        ).fetchone()
+        return (row and row[0]) or ""
+
+    def close(self):
+        self.db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='The graph of "oath id N" cross-references between oaths'
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser(
+        "build", help="build the graph from extracted oaths (JSON lines on stdin)"
+    )
+    build.add_argument("-o", "--output", default="oaths.graph")
+    links = commands.add_parser(
+        "links", help="the oaths an oath refers to, and those referring to it"
+    )
+    neighbourhood = commands.add_parser(
+        "neighbourhood", help="the oaths within --depth links of an oath"
+    )
+    neighbourhood.add_argument("-d", "--depth", type=int, default=2)
+    component = commands.add_parser("component", help="every oath connected to an oath")
+    components = commands.add_parser(
+        "components", help="the sizes of the largest connected components"
+    )
+    components.add_argument("-n", "--limit", type=int, default=10)
+    for command in (links, neighbourhood, component):
+        command.add_argument("oath_id", type=int)
+    for command in (links, neighbourhood, component, components):
+        command.add_argument("-g", "--graph", default="oaths.graph")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        records = (json.loads(line) for line in sys.stdin)
+        oaths, link_count = build_graph(records, args.output)
+        sys.stderr.write(
+            f"Linked {oaths} oaths by {link_count} references in {args.output}\n"
+        )
+        return
+
+    graph = OathGraph(args.graph)
+    if args.command == "links":
+        for target in graph.references(args.oath_id):
+            print(f"->\t{target}\t{graph.label(target)}")
+        for source in graph.referenced_by(args.oath_id):
+            print(f"<-\t{source}\t{graph.label(source)}")
+    elif args.command == "neighbourhood":
+        distances = graph.neighbourhood(args.oath_id, args.depth)
+        for oath_id, distance in sorted(
+            distances.items(), key=lambda item: (item[1], item[0])
+        ):
+            print(f"{distance}\t{oath_id}\t{graph.label(oath_id)}")
+    elif args.command == "component":
+        for oath_id in graph.component(args.oath_id):
+            print(f"{oath_id}\t{graph.label(oath_id)}")
+    else:
+        for size, component_id in graph.largest_components(args.limit):
+            print(f"{size}\t{component_id}\t{graph.label(component_id)}")
+    graph.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import argparse
+import sys
+
+import numpy as np
+
+from agent_registry import AGENT_FIELDS, add_agent_table_argument, agent_records
+from records import read_input
+
+# multi-valued fields of an extracted oath, and the agent lists whose
+# attributes are exploded together, one entry per agent
+LIST_FIELDS = ["proposed_by", "gods_invoked", "related_oaths"]
+AGENT_LISTS = ["swearer", "swearee"]
+
+
+class Column:
+    """
+    A dictionary-encoded column: codes[i] is the index in categories of
+    the i-th value, and rows[i] the oath (table row) it belongs to. For a
+    single-valued field rows is every row once, in order; for an exploded
+    multi-valued field it repeats a row once per value. Columns exploded
+    from the same list (the attributes of each swearer) share a group,
+    and pair up entry by entry rather than row by row.
+    """
+
+    def __init__(self, codes, categories, rows, exploded=False, group=None):
+        self.codes = codes
+        self.categories = categories
+        self.rows = rows
+        self.exploded = exploded
+        self.group = group
+
+    @classmethod
+    def encode(cls, values, rows, exploded=False, group=None):
+        index = {}
+        codes = np.fromiter(
+            (index.setdefault(value, len(index)) for value in values),
+            dtype=np.int32,
+            count=len(rows),
+        )
+        return cls(codes, list(index), rows, exploded, group)
+
+
+class OathTable:
+    """
+    Extracted oaths held column by column in NumPy arrays, with counts,
+    crosstabs, group-bys and histograms computed without a Python loop
+    over the rows
+
+        table = OathTable(records)
+        table.crosstab("genre", "gods_invoked")
+    """
+
+    def __init__(self, records):
+        records = [oath for oath in records if oath.get("oath_id")]
+        self.length = len(records)
+        every_row = np.arange(self.length, dtype=np.int32)
+        self.columns = {}
+        # per-oath numbers: the oath id and how many values each list has
+        self.numbers = {
+            "oath_id": np.array([oath["oath_id"] for oath in records], dtype=np.int64)
+        }
+        keys = {}
+        for oath in records:
+            keys.update(dict.fromkeys(oath))
+        for key in keys:
+            if key in LIST_FIELDS or key in AGENT_LISTS or key == "oath_id":
+                continue
+            self.columns[key] = Column.encode(
+                (oath.get(key, "") for oath in records), every_row
+            )
+        for key in LIST_FIELDS + AGENT_LISTS:
+            lists = [oath.get(key, []) for oath in records]
+            lengths = np.array([len(values) for values in lists], dtype=np.int32)
+            self.numbers[f"{key}_count"] = lengths
+            rows = np.repeat(every_row, lengths)
+            values = [value for values in lists for value in values]
+            if key in LIST_FIELDS:
+                self.columns[key] = Column.encode(values, rows, exploded=True)
+                continue
+            for field in AGENT_FIELDS:
+                self.columns[f"{key}.{field}"] = Column.encode(
+                    (agent[field] for agent in values), rows, exploded=True, group=key
+                )
+
+    def column(self, name):
+        if name not in self.columns:
+            raise KeyError(f"No column {name!r}; columns are {', '.join(self.columns)}")
+        return self.columns[name]
+
+    def number(self, name):
+        if name not in self.numbers:
+            raise KeyError(
+                f"No numeric column {name!r}; they are {', '.join(self.numbers)}"
+            )
+        return self.numbers[name]
+
+    def counts(self, name):
+        """
+        [(value, count)] of a column, most common first
+        """
+        column = self.column(name)
+        counts = np.bincount(column.codes, minlength=len(column.categories))
+        order = np.argsort(-counts, kind="stable")
+        return [(column.categories[i], int(counts[i])) for i in order]
+
+    def pair(self, first, second):
+        """
+        (first codes, second codes) of every pair of values of the two
+        columns that belong together: the same entry of one exploded list,
+        or else every combination of values within the same row
+        """
+        if first.group is not None and first.group == second.group:
+            return first.codes, second.codes
+        if not second.exploded:
+            return first.codes, second.codes[first.rows]
+        if not first.exploded:
+            return first.codes[second.rows], second.codes
+        # both exploded: repeat each first value once per second value in
+        # its row; rows are ascending, so a row's second values are contiguous
+        second_counts = np.bincount(second.rows, minlength=self.length)
+        second_starts = np.cumsum(second_counts) - second_counts
+        repeats = second_counts[first.rows]
+        first_index = np.repeat(np.arange(len(first.rows)), repeats)
+        offsets = np.arange(repeats.sum()) - np.repeat(
+            np.cumsum(repeats) - repeats, repeats
+        )
+        second_index = np.repeat(second_starts[first.rows], repeats) + offsets
+        return first.codes[first_index], second.codes[second_index]
+
+    def crosstab(self, first, second):
+        """
+        (first values, second values, counts) where counts[i, j] is how
+        often value i of column first occurs with value j of column second
+        """
+        first_column = self.column(first)
+        second_column = self.column(second)
+        first_codes, second_codes = self.pair(first_column, second_column)
+        width = len(second_column.categories)
+        counts = np.bincount(
+            first_codes.astype(np.int64) * width + second_codes,
+            minlength=len(first_column.categories) * width,
+        ).reshape(len(first_column.categories), width)
+        return first_column.categories, second_column.categories, counts
+
+    def group_by(self, by, number=None, aggregate="count"):
+        """
+        [(value, result)] of a numeric column (see self.numbers) aggregated
+        per value of column by, with aggregate one of count, sum or mean;
+        count needs no numeric column
+        """
+        column = self.column(by)
+        size = len(column.categories)
+        counts = np.bincount(column.codes, minlength=size)
+        if aggregate == "count":
+            results = counts
+        else:
+            weights = self.number(number)[column.rows].astype(np.float64)
+            results = np.bincount(column.codes, weights=weights, minlength=size)
+            if aggregate == "mean":
+                results = results / np.maximum(counts, 1)
+            elif aggregate != "sum":
+                raise ValueError(f"Unknown aggregate {aggregate!r}")
+        return [(column.categories[i], results[i].item()) for i in range(size)]
+
+    def histogram(self, number, bins=10):
+        """
+        (counts, bin edges) of a numeric column (see self.numbers)
+        """
+        return np.histogram(self.number(number), bins=bins)
+
+
+def load_table(path=None, format="json", prepare=None):
+    """
+    An OathTable of the records in path (default: stdin), passed through
+    prepare(records) first if given
+    """
+    prepare = prepare or iter
+    if path is None:
+        return OathTable(prepare(read_input(sys.stdin.buffer, format)))
+    with open(path, "rb") as f:
+        return OathTable(prepare(read_input(f, format)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Counts, crosstabs, group-bys and histograms over extracted oaths"
+    )
+    parser.add_argument(
+        "-i", "--input", help="extracted oaths to read (default: stdin)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=("json", "binary"),
+        default="json",
+        help="JSON lines, or the binary record format of transform.py --format binary",
+    )
+    add_agent_table_argument(parser)
+    commands = parser.add_subparsers(dest="command", required=True)
+    counts = commands.add_parser(
+        "counts", help="how often each value of a column occurs"
+    )
+    counts.add_argument("column")
+    counts.add_argument("-n", "--limit", type=int, default=0)
+    crosstab = commands.add_parser(
+        "crosstab", help="how often the values of two columns occur together"
+    )
+    crosstab.add_argument("rows")
+    crosstab.add_argument("columns")
+    group_by = commands.add_parser(
+        "groupby", help="aggregate a numeric column per value of a column"
+    )
+    group_by.add_argument("by")
+    group_by.add_argument("number", nargs="?")
+    group_by.add_argument(
+        "-a", "--aggregate", choices=("count", "sum", "mean"), default="count"
+    )
+    histogram = commands.add_parser("histogram", help="bin a numeric column")
+    histogram.add_argument("number")
+    histogram.add_argument("-b", "--bins", type=int, default=10)
+    commands.add_parser("columns", help="list the columns")
+    args = parser.parse_args(argv)
+
+    table = load_table(
+        args.input,
+        args.format,
+        lambda records: agent_records(records, args, parser),
+    )
+    try:
+        if args.command == "counts":
+            results = table.counts(args.column)
+            for value, count in results[: args.limit or None]:
+                print(f"{count}\t{value}")
+        elif args.command == "crosstab":
+            row_values, column_values, matrix = table.crosstab(args.rows, args.columns)
+            print("\t".join(["", *map(str, column_values)]))
+            for value, row in zip(row_values, matrix):
+                print("\t".join([str(value), *map(str, row)]))
+        elif args.command == "groupby":
+            if args.aggregate != "count" and not args.number:
+                parser.error(f"--aggregate {args.aggregate} needs a numeric column")
+            for value, result in table.group_by(args.by, args.number, args.aggregate):
+                print(f"{value}\t{result:g}")
+        elif args.command == "histogram":
+            counts, edges = table.histogram(args.number, args.bins)
+            for count, low, high in zip(counts, edges, edges[1:]):
+                print(f"{low:g}\t{high:g}\t{count}")
+        else:
+            print("columns:", ", ".join(table.columns))
+            print("numeric:", ", ".join(table.numbers))
+    except (KeyError, ValueError) as e:
+        sys.exit(str(e).strip("'\""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+# A page archive is one file holding many saved pages:
+#   header: MAGIC, page count
+#   index:  per page, offset and length of its bytes, then its file name
+#   data:   the pages, back to back, in oath id order
+# A page inside an archive is addressed like a file in a directory,
+# e.g. oaths.pack/123.html, so archives drop in wherever a directory does.
+MAGIC = b"OATHPAK1"
+HEADER = struct.Struct("<8sI")
+ENTRY = struct.Struct("<QIH")
+
+# A page store is an append-only file of pages compressed one by one with
+# a shared zlib preset dictionary, so each stays individually readable:
+#   header:  STORE_MAGIC, dictionary length, the dictionary
+#   records: name length, compressed length, name, compressed page
+# It is addressed the same way as an archive, e.g. oaths.zpages/123.html.
+STORE_MAGIC = b"OATHZST1"
+STORE_HEADER = struct.Struct("<8sI")
+RECORD = struct.Struct("<HI")
+
+
+def oath_file_key(file):
+    """
+    Sort key for oath pages: numeric file names (the oath id) first, in order
+    """
+    stem = file.rsplit(".", 1)[0]
+    if stem.isdigit():
+        return (0, int(stem), file)
+    return (1, 0, file)
+
+
+class PageArchive:
+    """
+    Read access to a page archive through mmap; page_bytes slices a page
+    out of the mapping without copying it
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a page archive")
+        self.index = {}
+        position = HEADER.size
+        for _ in range(count):
+            offset, length, name_length = ENTRY.unpack_from(self.mmap, position)
+            position += ENTRY.size
+            name = self.mmap[position : position + name_length].decode()
+            position += name_length
+            self.index[name] = (offset, length)
+
+    def names(self):
+        return list(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def page_bytes(self, name):
+        offset, length = self.index[name]
+        return memoryview(self.mmap)[offset : offset + length]
+
+    def close(self):
+        self.mmap.close()
+
+
+def pack(directory, path):
+    """
+    Pack the *.html pages of directory into an archive at path.
+    Returns the number of pages.
+    """
+    names = oath_files(directory)
+    encoded = [name.encode() for name in names]
+    index_size = sum(ENTRY.size + len(name) for name in encoded)
+    tmp_path = path + ".tmp"
+    entries = []
+    with open(tmp_path, "wb") as archive:
+        # the data goes after the index; the index is written last,
+        # once the lengths are known
+        offset = HEADER.size + index_size
+        archive.seek(offset)
+        for name in names:
+            with open(os.path.join(directory, name), "rb") as f:
+                data = f.read()
+            archive.write(data)
+            entries.append((offset, len(data)))
+            offset += len(data)
+        archive.seek(0)
+        archive.write(HEADER.pack(MAGIC, len(names)))
+        for name, (offset, length) in zip(encoded, entries):
+            archive.write(ENTRY.pack(offset, length, len(name)))
+            archive.write(name)
+    os.replace(tmp_path, path)
+    return len(names)
+
+
+def build_dictionary(pages, size=32 * 1024):
+    """
+    A zlib preset dictionary made of whole sample pages, up to size bytes
+    (the zlib window). Every saved page repeats the same head, openwin
+    script, nav bar and table scaffolding, which then costs almost nothing.
+    """
+    return b"".join(pages)[-size:]
+
+
+def sample_dictionary_pages(directory, count=4):
+    """
+    count pages spread evenly over directory, skipping the oversized ones
+    (saved search forms) that would crowd the template out of the dictionary
+    """
+    paths = [os.path.join(directory, name) for name in oath_files(directory)]
+    sizes = sorted(os.path.getsize(path) for path in paths)
+    median = sizes[len(sizes) // 2]
+    typical = [path for path in paths if os.path.getsize(path) <= median]
+    step = max(1, len(typical) // count)
+    pages = []
+    for path in typical[::step][:count]:
+        with open(path, "rb") as f:
+            pages.append(f.read())
+    return pages
+
+
+class PageStore:
+    """
+    Reads and appends to a page store (see STORE_MAGIC). A later record
+    for a name replaces an earlier one; a record cut short by a crash is
+    ignored and overwritten by the next add().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        magic, dictionary_length = STORE_HEADER.unpack(
+            os.pread(self.fd, STORE_HEADER.size, 0)
+        )
+        if magic != STORE_MAGIC:
+            raise ValueError(f"{path} is not a page store")
+        self.dictionary = os.pread(self.fd, dictionary_length, STORE_HEADER.size)
+        self.index = {}
+        self.end = self.scan(STORE_HEADER.size + dictionary_length)
+        self.appender = None
+
+    @classmethod
+    def create(cls, path, dictionary):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(STORE_HEADER.pack(STORE_MAGIC, len(dictionary)))
+            f.write(dictionary)
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def scan(self, position):
+        size = os.fstat(self.fd).st_size
+        while position + RECORD.size <= size:
+            name_length, length = RECORD.unpack(
+                os.pread(self.fd, RECORD.size, position)
+            )
+            start = position + RECORD.size
+            if start + name_length + length > size:
+                break
+            name = os.pread(self.fd, name_length, start).decode()
+            self.index[name] = (start + name_length, length)
+            position = start + name_length + length
+        return position
+
+    def names(self):
+        return list(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def page_bytes(self, name):
+        offset, length = self.index[name]
+        decompressor = zlib.decompressobj(zdict=self.dictionary)
+        data = decompressor.decompress(os.pread(self.fd, length, offset))
+        return data + decompressor.flush()
+
+    def add(self, name, data):
+        """
+        Compress and append a page, replacing any earlier one of that name
+        """
+        compressor = zlib.compressobj(9, zdict=self.dictionary)
+        compressed = compressor.compress(data) + compressor.flush()
+        encoded = name.encode()
+        if self.appender is None:
+            # kept open for later adds, and closed by close()
+            self.appender = open(self.path, "r+b")  # noqa: SIM115
+        self.appender.seek(self.end)
+        self.appender.write(RECORD.pack(len(encoded), len(compressed)))
+        self.appender.write(encoded)
+        self.appender.write(compressed)
+        self.appender.truncate()
+        self.appender.flush()
+        offset = self.end + RECORD.size + len(encoded)
+        self.index[name] = (offset, len(compressed))
+        self.end = offset + len(compressed)
+
+    def close(self):
+        if self.appender is not None:
+            os.fsync(self.appender.fileno())
+            self.appender.close()
+        os.close(self.fd)
+
+
+def compress_directory(directory, path):
+    """
+    Write the *.html pages of directory to a new page store at path, with
+    a dictionary sampled from the directory. Returns the number of pages.
+    """
+    tmp_path = path + ".new"
+    store = PageStore.create(
+        tmp_path, build_dictionary(sample_dictionary_pages(directory))
+    )
+    names = oath_files(directory)
+    for name in names:
+        with open(os.path.join(directory, name), "rb") as f:
+            store.add(name, f.read())
+    store.close()
+    os.replace(tmp_path, path)
+    return len(names)
+
+
+# archives and stores opened by this process, by path
+archives = {}
+
+
+def archive_kind(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+    if magic == MAGIC:
+        return PageArchive
+    if magic == STORE_MAGIC:
+        return PageStore
+    return None
+
+
+def is_archive(path):
+    """
+    Whether path is a page archive or page store
+    """
+    return path in archives or archive_kind(path) is not None
+
+
+def open_archive(path):
+    archive = archives.get(path)
+    if archive is None:
+        archive = archives[path] = archive_kind(path)(path)
+    return archive
+
+
+def is_page_source(path):
+    """
+    Whether path holds many pages: a directory, archive or page store
+    """
+    return os.path.isdir(path) or is_archive(path)
+
+
+def oath_files(source):
+    """
+    List the *.html pages in a directory, archive or store, ordered by oath id
+    """
+    if is_archive(source):
+        names = open_archive(source).names()
+    else:
+        names = os.listdir(source)
+    files = [file for file in names if file.endswith(".html")]
+    return sorted(files, key=oath_file_key)
+
+
+def archive_member(path):
+    """
+    (archive, name) if path is a page inside an archive or store, else None
+    """
+    source, name = os.path.split(path)
+    if source and is_archive(source):
+        return source, name
+    return None
+
+
+def read_page_bytes(path):
+    member = archive_member(path)
+    if member:
+        source, name = member
+        return open_archive(source).page_bytes(name)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def read_page(path):
+    """
+    The text of a page, from a file, archive or store; undecodable bytes are
+    dropped, as reading the file in text mode with errors="ignore" does
+    """
+    text = str(read_page_bytes(path), "utf-8", "ignore")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def page_exists(path):
+    member = archive_member(path)
+    if member:
+        source, name = member
+        return name in open_archive(source)
+    return os.path.exists(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Page archives of saved oath pages")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack_command = commands.add_parser(
+        "pack", help="pack a directory of pages into one archive file"
+    )
+    pack_command.add_argument("directory")
+    pack_command.add_argument("archive")
+    compress_command = commands.add_parser(
+        "compress",
+        help="compress a directory of pages into a page store, "
+        "with a dictionary built from its shared template",
+    )
+    compress_command.add_argument("directory")
+    compress_command.add_argument("store")
+    list_command = commands.add_parser(
+        "list", help="list the pages in an archive or store"
+    )
+    list_command.add_argument("archive")
+    args = parser.parse_args(argv)
+
+    if args.command == "pack":
+        count = pack(args.directory, args.archive)
+        sys.stderr.write(f"Packed {count} pages into {args.archive}\n")
+    elif args.command == "compress":
+        count = compress_directory(args.directory, args.store)
+        size = os.path.getsize(args.store)
+        sys.stderr.write(f"Compressed {count} pages into {args.store} ({size} bytes)\n")
+    else:
+        archive = open_archive(args.archive)
+        for name in archive.names():
+            offset, length = archive.index[name]
+            print(f"{name}\t{offset}\t{length}")
+
+
+if __name__ == "__main__":
+    main()
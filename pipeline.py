@@ -0,0 +1,81 @@
+import argparse
+import csv
+
+from agent_registry import AgentRegistry
+from json_to_agents import oath_agents
+from json_to_oaths import StreamingCSVWriter, normalize_dict
+from pages import is_page_source
+from transform import (
+    RECORD_KEYS,
+    add_extraction_arguments,
+    err_print,
+    extracted_records,
+)
+
+
+def run_pipeline(records, oaths_path, agents_path, registry=None):
+    """
+    Write oaths_path and agents_path in one pass over the extracted records.
+    Rows are written as they arrive, oath rows under the columns of
+    transform.RECORD_KEYS (through a spill file from the first row with a
+    field that has no handler, so it still gets a header); only the distinct
+    agents seen so far are kept in memory, in registry (an AgentRegistry).
+    """
+    if registry is None:
+        registry = AgentRegistry()
+    agent_writer = None
+    skipped = 0
+    with (
+        StreamingCSVWriter(oaths_path, RECORD_KEYS, extras="spill") as oath_writer,
+        open(agents_path, "w", newline="") as agents_file,
+    ):
+        for oath in records:
+            if not oath.get("oath_id"):
+                # pages that were not oath results (e.g. the search form)
+                skipped += 1
+                continue
+            oath_writer.writerow(normalize_dict(oath))
+            for agent in oath_agents(oath):
+                new_name = not registry.has_name(agent["agent"])
+                registry.intern(agent)
+                if not new_name:
+                    continue
+                if agent_writer is None:
+                    agent_writer = csv.DictWriter(agents_file, fieldnames=agent.keys())
+                    agent_writer.writeheader()
+                agent_writer.writerow(agent)
+    if skipped:
+        err_print(f"Skipped {skipped} page(s) without an oath id")
+    registry.report_conflicts()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Extract a directory of oath pages straight to oaths.csv and agents.csv"
+    )
+    parser.add_argument("path", help="directory or archive of saved oath pages")
+    parser.add_argument(
+        "--oaths", default="oaths.csv", help="oaths CSV to write (default: oaths.csv)"
+    )
+    parser.add_argument(
+        "--agents",
+        default="agents.csv",
+        help="agents CSV to write (default: agents.csv)",
+    )
+    parser.add_argument(
+        "--agent-table",
+        metavar="FILE",
+        help="also write every distinct agent attribute set, with integer ids, to FILE",
+    )
+    add_extraction_arguments(parser)
+    args = parser.parse_args(argv)
+    if not is_page_source(args.path):
+        parser.error(f"{args.path} is not a directory or archive")
+    registry = AgentRegistry()
+    run_pipeline(extracted_records(args), args.oaths, args.agents, registry)
+    if args.agent_table:
+        registry.write_csv(args.agent_table)
+
+
+if __name__ == "__main__":
+    main()
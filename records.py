@@ -0,0 +1,253 @@
+import argparse
+import json
+import struct
+import sys
+
+from agent_registry import AGENT_FIELDS
+
+# A record file is a compact binary alternative to the JSON lines that
+# transform.py writes, for re-reading one extraction many times:
+#   header:  MAGIC, length of the JSON schema, the schema (RECORD_FIELDS)
+#   records: kind, new string count, string block length, token count,
+#            the string block, then the tokens (uint32)
+# Strings are interned across the file: each distinct string is stored
+# once, in the string block of the record that first uses it ("\0"
+# separated), and afterwards referred to by its index in that order.
+# A FIXED record has exactly the schema's keys in order, so it stores no
+# key names. Its tokens are the str fields in schema order, then the
+# other fields in schema order:
+#   int:    the value
+#   str:    a string index
+#   list:   a count, then string indexes
+#   ints:   a count, then the values
+#   agents: a count, then len(AGENT_FIELDS) string indexes per agent
+# Anything else is a JSON record: its string block is the JSON text.
+MAGIC = b"OATHREC1"
+LENGTH = struct.Struct("<I")
+RECORD_HEADER = struct.Struct("<BIII")
+FIXED = 0
+JSON = 1
+
+# (key, kind) of an extracted oath, in extraction order
+RECORD_FIELDS = [
+    ("oath_id", "int"),
+    ("author", "str"),
+    ("title", "str"),
+    ("reference", "str"),
+    ("work_type", "str"),
+    ("genre", "str"),
+    ("work_date", "str"),
+    ("date", "str"),
+    ("reference_type", "str"),
+    ("state", "str"),
+    ("swearer", "agents"),
+    ("swearee", "agents"),
+    ("proposed_by", "list"),
+    ("if_taken", "str"),
+    ("if_refused", "str"),
+    ("if_kept", "str"),
+    ("if_broken", "str"),
+    ("taken", "str"),
+    ("impact", "str"),
+    ("consequences_of_breach", "str"),
+    ("statement", "str"),
+    ("linguistic", "str"),
+    ("gods_invoked", "list"),
+    ("remarks", "str"),
+    ("related_oaths", "ints"),
+]
+
+
+def is_uint32(value):
+    return type(value) is int and 0 <= value < 1 << 32
+
+
+def is_string(value):
+    return isinstance(value, str) and "\0" not in value
+
+
+def fits_schema(record, fields):
+    """
+    Whether record can be stored as a FIXED record
+    """
+    if len(record) != len(fields):
+        return False
+    for (key, value), (field, kind) in zip(record.items(), fields):
+        if key != field:
+            return False
+        if kind == "int":
+            if not is_uint32(value):
+                return False
+        elif kind == "ints":
+            if not isinstance(value, list) or not all(map(is_uint32, value)):
+                return False
+        elif kind == "str":
+            if not is_string(value):
+                return False
+        elif kind == "list":
+            if not isinstance(value, list) or not all(map(is_string, value)):
+                return False
+        elif not isinstance(value, list) or not all(
+            isinstance(agent, dict)
+            and tuple(agent) == AGENT_FIELDS
+            and all(map(is_string, agent.values()))
+            for agent in value
+        ):
+            return False
+    return True
+
+
+class RecordWriter:
+    """
+    Writes extracted records to a binary file object in the record format
+
+        writer = RecordWriter(sys.stdout.buffer)
+        writer.write(features)
+    """
+
+    def __init__(self, file, fields=RECORD_FIELDS):
+        self.file = file
+        self.fields = fields
+        self.ids = {}
+        schema = json.dumps({"fields": fields, "agent_fields": AGENT_FIELDS}).encode()
+        file.write(MAGIC + LENGTH.pack(len(schema)) + schema)
+
+    def write(self, record):
+        if not fits_schema(record, self.fields):
+            block = json.dumps(record).encode()
+            self.file.write(RECORD_HEADER.pack(JSON, 0, len(block), 0) + block)
+            return
+        ids = self.ids
+        new = []
+
+        def string_id(value):
+            string_id = ids.get(value)
+            if string_id is None:
+                string_id = ids[value] = len(ids)
+                new.append(value)
+            return string_id
+
+        tokens = []
+        for key, kind in self.fields:
+            if kind == "str":
+                tokens.append(string_id(record[key]))
+        for key, kind in self.fields:
+            value = record[key]
+            if kind == "int":
+                tokens.append(value)
+            elif kind == "ints":
+                tokens.append(len(value))
+                tokens.extend(value)
+            elif kind == "list":
+                tokens.append(len(value))
+                tokens.extend(map(string_id, value))
+            elif kind == "agents":
+                tokens.append(len(value))
+                for agent in value:
+                    tokens.extend(map(string_id, agent.values()))
+        block = "\0".join(new).encode()
+        self.file.write(
+            RECORD_HEADER.pack(FIXED, len(new), len(block), len(tokens))
+            + block
+            + struct.pack(f"<{len(tokens)}I", *tokens)
+        )
+
+
+def write_records(records, file):
+    writer = RecordWriter(file)
+    for record in records:
+        writer.write(record)
+
+
+def read_exactly(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        raise ValueError("truncated record file")
+    return data
+
+
+def iter_records(file):
+    """
+    Yield the records of a binary file object in the record format, as
+    the dicts that were written
+    """
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not a record file")
+    (length,) = LENGTH.unpack(read_exactly(file, LENGTH.size))
+    schema = json.loads(read_exactly(file, length))
+    fields = [tuple(field) for field in schema["fields"]]
+    keys = [key for key, _ in fields]
+    agent_fields = tuple(schema["agent_fields"])
+    width = len(agent_fields)
+    # FIXED tokens hold the str fields first, then the others, which are
+    # inserted among them in schema order
+    texts = sum(kind == "str" for _, kind in fields)
+    others = [(index, kind) for index, (_, kind) in enumerate(fields) if kind != "str"]
+    strings = []
+    while True:
+        header = file.read(RECORD_HEADER.size)
+        if not header:
+            return
+        if len(header) != RECORD_HEADER.size:
+            raise ValueError("truncated record file")
+        kind, count, block_length, token_count = RECORD_HEADER.unpack(header)
+        block = read_exactly(file, block_length)
+        if kind == JSON:
+            yield json.loads(block)
+            continue
+        if count:
+            strings.extend(block.decode().split("\0"))
+        tokens = struct.unpack(f"<{token_count}I", read_exactly(file, 4 * token_count))
+        values = list(map(strings.__getitem__, tokens[:texts]))
+        position = texts
+        for index, field_kind in others:
+            token = tokens[position]
+            position += 1
+            if field_kind == "int":
+                value = token
+                end = position
+            elif field_kind == "ints":
+                end = position + token
+                value = list(tokens[position:end])
+            elif field_kind == "list":
+                end = position + token
+                value = list(map(strings.__getitem__, tokens[position:end]))
+            else:
+                end = position + token * width
+                names = list(map(strings.__getitem__, tokens[position:end]))
+                value = [
+                    dict(zip(agent_fields, names[i : i + width]))
+                    for i in range(0, len(names), width)
+                ]
+            values.insert(index, value)
+            position = end
+        yield dict(zip(keys, values))
+
+
+def read_input(file, format):
+    """
+    The records in a binary file object holding JSON lines or, for
+    format "binary", the record format
+    """
+    if format == "binary":
+        return iter_records(file)
+    return (json.loads(line) for line in file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert extracted oaths between JSON lines and the binary "
+        "record format (stdin to stdout)"
+    )
+    parser.add_argument("direction", choices=("to-json", "from-json"))
+    args = parser.parse_args(argv)
+    if args.direction == "from-json":
+        write_records(read_input(sys.stdin.buffer, "json"), sys.stdout.buffer)
+    else:
+        for record in iter_records(sys.stdin.buffer):
+            sys.stdout.write(json.dumps(record))
+            sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
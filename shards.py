@@ -0,0 +1,109 @@
+import argparse
+import heapq
+import json
+import os
+import sys
+from contextlib import nullcontext
+from operator import itemgetter
+
+
+def oath_key(record):
+    """
+    Sort key for extracted records: by oath id, records without one last
+    """
+    oath_id = record.get("oath_id")
+    if oath_id:
+        return (0, oath_id)
+    return (1, 0)
+
+
+def write_shard(records, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record))
+            f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def is_shard(name):
+    return name.startswith("shard-") and name.endswith(".ndjson")
+
+
+def write_shards(records, directory, shard_size=1000):
+    """
+    Write records to directory as NDJSON shards of at most shard_size
+    records, each sorted by oath_key, holding one shard in memory at a
+    time. Shards of an earlier run in directory are removed first, so
+    they are never merged with these. Returns the shard paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if is_shard(name):
+            os.remove(os.path.join(directory, name))
+    paths = []
+    batch = []
+
+    def flush():
+        batch.sort(key=oath_key)
+        path = os.path.join(directory, f"shard-{len(paths):05d}.ndjson")
+        write_shard(batch, path)
+        paths.append(path)
+        batch.clear()
+
+    for record in records:
+        batch.append(record)
+        if len(batch) >= shard_size:
+            flush()
+    if batch:
+        flush()
+    return paths
+
+
+def shard_paths(sources):
+    """
+    The shard files in sources, each a shard or a directory of them
+    """
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            names = sorted(n for n in os.listdir(source) if n.endswith(".ndjson"))
+            paths.extend(os.path.join(source, name) for name in names)
+        else:
+            paths.append(source)
+    return paths
+
+
+def read_shard(path):
+    with open(path) as f:
+        for line in f:
+            yield oath_key(json.loads(line)), line
+
+
+def merge_shards(paths):
+    """
+    Yield the lines of sorted shards in oath_key order, holding one line
+    per shard. Equal keys come out in shard order, so the same shards
+    always merge to the same output.
+    """
+    streams = [read_shard(path) for path in paths]
+    for _, line in heapq.merge(*streams, key=itemgetter(0)):
+        yield line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Merge sorted shards of extracted oaths (from transform.py "
+        "--shard-dir) into one stream ordered by oath id"
+    )
+    parser.add_argument(
+        "sources", nargs="+", help="shard files, or directories of shards"
+    )
+    parser.add_argument("-o", "--output", help="write here instead of stdout")
+    args = parser.parse_args(argv)
+    with open(args.output, "w") if args.output else nullcontext(sys.stdout) as out:
+        out.writelines(merge_shards(shard_paths(args.sources)))
+
+
+if __name__ == "__main__":
+    main()
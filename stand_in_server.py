@@ -0,0 +1,204 @@
+import argparse
+import hashlib
+import os
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class RateLimiter:
+    """
+    A token bucket shared by the server's threads: burst requests may come
+    at once, after which tokens refill at rate per second
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves oath_reference_details.php?oathID=N from a directory of saved
+    pages, standing in for the database site when testing the crawler.
+    Pages carry an ETag and Last-Modified, and conditional requests for
+    unchanged pages get 304 Not Modified. With a limiter (a RateLimiter),
+    requests over its rate get the site's "You have been timed out" page.
+
+    The database root serves a saved search form page, and the form's
+    POST to reference_list.php with an oathID gets that oath's page, so
+    the form-driven browser path (browser_pool.py --form) can be tested.
+    """
+
+    # HTTP/1.1 so clients can keep connections alive, like the real site
+    protocol_version = "HTTP/1.1"
+    directory = "oaths"
+    verbose = False
+    limiter = None
+    # the saved page holding the search form, found on first use
+    search_form = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.endswith("/database/"):
+            self.send_search_form()
+            return
+        if not url.path.endswith("/oath_reference_details.php"):
+            self.send_text(404, "Not found")
+            return
+        self.send_oath(parse_qs(url.query).get("oathID", [""])[0])
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode("latin-1"))
+        if not url.path.endswith("/reference_list.php"):
+            self.send_text(404, "Not found")
+            return
+        self.send_oath(form.get("oathID", [""])[0])
+
+    def send_search_form(self):
+        cls = type(self)
+        if cls.search_form is None:
+            cls.search_form = find_search_form(self.directory)
+        if not cls.search_form:
+            self.send_text(404, "No saved search form page")
+            return
+        with open(cls.search_form, "rb") as f:
+            self.send_body(200, f.read())
+
+    def send_oath(self, oath_id):
+        if self.limiter is not None and not self.limiter.allow():
+            self.send_text(200, "You have been timed out")
+            return
+        path = os.path.join(self.directory, f"{oath_id}.html")
+        if not oath_id.isdigit() or not os.path.exists(path):
+            self.send_text(200, "Error - unable to retrieve work")
+            return
+        with open(path, "rb") as f:
+            body = f.read()
+        mtime = int(os.path.getmtime(path))
+        headers = {
+            "ETag": '"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+            "Last-Modified": formatdate(mtime, usegmt=True),
+        }
+        if self.not_modified(headers["ETag"], mtime):
+            self.send_body(304, b"", headers)
+            return
+        self.send_body(200, body, headers)
+
+    def not_modified(self, etag, mtime):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in (tag.strip() for tag in if_none_match.split(","))
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return mtime <= since
+        return False
+
+    def send_text(self, status, text):
+        self.send_body(status, f"<html><body>{text}</body></html>".encode())
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def find_search_form(directory):
+    """
+    The path of a saved page in directory holding the search form, or ""
+    """
+    with os.scandir(directory) as entries:
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            if not entry.name.endswith(".html"):
+                continue
+            with open(entry.path, "rb") as f:
+                if b'id="oathReferenceID"' in f.read():
+                    return entry.path
+    return ""
+
+
+def make_server(
+    directory="oaths", host="127.0.0.1", port=0, verbose=False, limiter=None
+):
+    """
+    A stand-in server for directory; port 0 picks a free port, see
+    server.server_address. Run it with server.serve_forever().
+    """
+    handler = type(
+        "Handler",
+        (StandInHandler,),
+        {"directory": directory, "verbose": verbose, "limiter": limiter},
+    )
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/~brzoaths/database/"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve saved oath pages the way the database site does"
+    )
+    parser.add_argument("directory", nargs="?", default="oaths")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        help="answer requests beyond this many per second with the site's "
+        '"You have been timed out" page',
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=1,
+        help="requests allowed at once before --rate-limit applies (default: 1)",
+    )
+    args = parser.parse_args(argv)
+    limiter = RateLimiter(args.rate_limit, args.burst) if args.rate_limit else None
+    server = make_server(args.directory, args.host, args.port, args.verbose, limiter)
+    print(f"Serving {args.directory} at {base_url(server)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
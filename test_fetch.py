@@ -0,0 +1,138 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from fetch import Fetcher, Manifest, RateController
+from stand_in_server import RateLimiter, base_url, make_server
+
+# saved pages served by the stand-in; oath 7 is missing, so it gets the
+# site's "Error - unable to retrieve work" page
+SERVED = range(2, 7)
+MISSING = 7
+OATHS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "oaths")
+
+
+class RecordingFetcher(Fetcher):
+    """
+    A Fetcher that keeps the status code of every response
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statuses = []
+
+    def get(self, number, headers=None):
+        response = super().get(number, headers)
+        self.statuses.append(response.status_code)
+        return response
+
+
+class FetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp, "source")
+        self.pages = os.path.join(self.tmp, "pages")
+        self.manifest_path = os.path.join(self.tmp, "manifest.json")
+        os.mkdir(self.source)
+        for number in SERVED:
+            shutil.copy(os.path.join(OATHS, f"{number}.html"), self.source)
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        shutil.rmtree(self.tmp)
+
+    def serve(self, limiter=None):
+        self.server = make_server(self.source, limiter=limiter)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return base_url(self.server)
+
+    def fetch(self, url, start=SERVED[0], end=MISSING, **options):
+        fetcher = RecordingFetcher(
+            self.pages, url, manifest=Manifest(self.manifest_path), **options
+        )
+        try:
+            asyncio.run(fetcher.fetch_range(start, end))
+        finally:
+            fetcher.close()
+        return fetcher
+
+    def assert_pages_match_source(self):
+        for number in SERVED:
+            with open(os.path.join(self.source, f"{number}.html"), "rb") as f:
+                expected = f.read()
+            with open(os.path.join(self.pages, f"{number}.html"), "rb") as f:
+                self.assertEqual(f.read(), expected)
+
+    def test_saves_pages_then_skips_them(self):
+        url = self.serve()
+        fetcher = self.fetch(url)
+        self.assertEqual(fetcher.fetched, len(SERVED))
+        self.assertEqual(fetcher.invalid, 1)
+        self.assertEqual(sorted(fetcher.changed), list(SERVED))
+        self.assertFalse(os.path.exists(os.path.join(self.pages, f"{MISSING}.html")))
+        self.assert_pages_match_source()
+
+        again = self.fetch(url)
+        self.assertEqual(again.skipped, len(SERVED))
+        self.assertEqual(again.fetched, 0)
+
+    def test_refresh_revalidates_with_304s(self):
+        url = self.serve()
+        self.fetch(url, end=SERVED[-1])
+        refreshed = self.fetch(url, end=SERVED[-1], refresh=True)
+        self.assertEqual(refreshed.statuses, [304] * len(SERVED))
+        self.assertEqual(refreshed.unchanged, len(SERVED))
+        self.assertEqual(refreshed.changed, [])
+
+        with open(os.path.join(self.source, "3.html"), "a") as f:
+            f.write("<!-- revised -->\n")
+        refreshed = self.fetch(url, end=SERVED[-1], refresh=True)
+        self.assertEqual(refreshed.changed, [3])
+        self.assertEqual(refreshed.unchanged, len(SERVED) - 1)
+        self.assert_pages_match_source()
+
+    def test_retries_timed_out_pages_under_a_rate_limit(self):
+        url = self.serve(RateLimiter(rate=10, burst=1))
+        controller = RateController(rate=50, max_rate=100)
+        fetcher = self.fetch(
+            url,
+            end=SERVED[-1],
+            controller=controller,
+            retries=8,
+            retry_delay=0.05,
+        )
+        self.assertGreater(controller.timeouts, 0)
+        self.assertGreater(fetcher.retried, 0)
+        self.assertLess(controller.rate, 50)
+        self.assertEqual(fetcher.invalid, 0)
+        self.assertEqual(fetcher.fetched, len(SERVED))
+        self.assert_pages_match_source()
+
+
+class RateControllerTest(unittest.TestCase):
+    def test_cuts_once_per_congestion_event(self):
+        async def run():
+            controller = RateController(rate=8, max_rate=100)
+            # four requests in flight all time out: one cut
+            turns = [await controller.wait() for _ in range(4)]
+            for number, cuts in enumerate(turns):
+                controller.timed_out(number, cuts)
+            after_first_event = controller.rate
+            # a request granted after that cut times out: a second cut
+            controller.timed_out(4, await controller.wait())
+            return controller, after_first_event
+
+        controller, after_first_event = asyncio.run(run())
+        self.assertEqual(after_first_event, 4)
+        self.assertEqual(controller.rate, 2)
+        self.assertEqual(controller.timeouts, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
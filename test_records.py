@@ -0,0 +1,135 @@
+import io
+import unittest
+
+from records import (
+    FIXED,
+    JSON,
+    LENGTH,
+    MAGIC,
+    RECORD_FIELDS,
+    RECORD_HEADER,
+    iter_records,
+    write_records,
+)
+
+AGENT = {
+    "agent": "Chorus",
+    "gender": "male",
+    "age": "mature",
+    "status": "free",
+    "origin": "Athenian",
+}
+
+
+def oath(oath_id, **values):
+    """
+    A record with every field of the schema, in schema order
+    """
+    defaults = {"int": oath_id, "str": "", "list": [], "ints": [], "agents": []}
+    record = {key: defaults[kind] for key, kind in RECORD_FIELDS}
+    record.update(values)
+    return record
+
+
+def encode(records):
+    file = io.BytesIO()
+    write_records(records, file)
+    return file.getvalue()
+
+
+def decode(data):
+    return list(iter_records(io.BytesIO(data)))
+
+
+def record_offsets(data):
+    """
+    (offset, kind) of each record in an encoded file
+    """
+    (length,) = LENGTH.unpack_from(data, len(MAGIC))
+    offset = len(MAGIC) + LENGTH.size + length
+    records = []
+    while offset < len(data):
+        kind, _, block_length, token_count = RECORD_HEADER.unpack_from(data, offset)
+        records.append((offset, kind))
+        offset += RECORD_HEADER.size + block_length + 4 * token_count
+    return records
+
+
+def record_kinds(data):
+    return [kind for _, kind in record_offsets(data)]
+
+
+class RecordFormatTest(unittest.TestCase):
+    def assert_round_trip(self, records):
+        data = encode(records)
+        decoded = decode(data)
+        # same keys in the same order, not only equal dicts
+        self.assertEqual(
+            [list(r.items()) for r in decoded], [list(r.items()) for r in records]
+        )
+        return data
+
+    def test_fixed_records(self):
+        records = [
+            oath(
+                12,
+                author="Aristophanes",
+                title="Clouds",
+                swearer=[AGENT],
+                swearee=[AGENT, dict(AGENT, agent="Strepsiades")],
+                proposed_by=["Socrates"],
+                gods_invoked=["Zeus", "Poseidon"],
+                remarks="See oath ids 13-14",
+                related_oaths=[13, 14],
+            ),
+            # strings of the first record are referred to, not stored again
+            oath(13, author="Aristophanes", title="Clouds", gods_invoked=["Zeus"]),
+        ]
+        data = self.assert_round_trip(records)
+        self.assertEqual(record_kinds(data), [FIXED, FIXED])
+        self.assertEqual(data.count(b"Aristophanes"), 1)
+
+    def test_json_fallback(self):
+        missing = oath(20)
+        del missing["remarks"]
+        records = [
+            oath(19, author="Homer"),
+            missing,
+            dict(oath(21), extra="a field outside the schema"),
+            oath(22, author="nul\0in a string"),
+            oath(1 << 32),
+            oath(23, swearer=[{"agent": "Chorus"}]),
+            oath(24, swearer=[1, 2]),
+            oath(25, author="Homer", title="Iliad"),
+        ]
+        data = self.assert_round_trip(records)
+        self.assertEqual(record_kinds(data), [FIXED] + [JSON] * 6 + [FIXED])
+
+    def test_empty_string_in_the_string_table(self):
+        # the first record's only new string is "", an empty string block
+        records = [
+            oath(30),
+            oath(31, author="Sophocles", title=""),
+            oath(32, title="", proposed_by=["", "Creon"]),
+        ]
+        data = self.assert_round_trip(records)
+        self.assertEqual(record_kinds(data), [FIXED] * 3)
+
+    def test_truncated_file(self):
+        data = encode([oath(40, author="Euripides"), oath(41, remarks="x\0y")])
+        self.assertEqual(record_kinds(data), [FIXED, JSON])
+        # a file may only end after the schema or a whole record
+        ends = {offset for offset, _ in record_offsets(data)}
+        for end in range(len(MAGIC), len(data)):
+            if end in ends:
+                continue
+            with self.subTest(end=end), self.assertRaises(ValueError):
+                decode(data[:end])
+
+    def test_not_a_record_file(self):
+        with self.assertRaises(ValueError):
+            decode(b'{"oath_id": 1}\n')
+
+
+if __name__ == "__main__":
+    unittest.main()
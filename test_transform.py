@@ -0,0 +1,53 @@
+import unittest
+
+from transform import MAX_OATH_ID_RANGE, oath_references
+
+
+class OathReferencesTest(unittest.TestCase):
+    def assert_references(self, text, expected):
+        with self.subTest(text=text):
+            self.assertEqual(oath_references(text), expected)
+
+    def test_single_ids(self):
+        self.assert_references("Compare oath id 188.", [188])
+        self.assert_references("see oath id. 1580", [1580])
+        self.assert_references("Oath ID 12 is similar", [12])
+        self.assert_references("as in oath id 7; cf. oath id 3", [3, 7])
+
+    def test_lists(self):
+        self.assert_references("oath ids 545, 559, 561", [545, 559, 561])
+        self.assert_references("oath ids 12 and 14", [12, 14])
+        self.assert_references("oath ids 12 & 14", [12, 14])
+        self.assert_references("oath ids 12 or 14", [12, 14])
+        self.assert_references("oath ids 545, 559, and 561", [545, 559, 561])
+
+    def test_ranges(self):
+        self.assert_references(
+            "oath ids 1367-1370 and 1372", [1367, 1368, 1369, 1370, 1372]
+        )
+        self.assert_references("oath ids 40 – 42", [40, 41, 42])
+
+    def test_abbreviated_range_ends(self):
+        self.assert_references("oath ids 1916-7", [1916, 1917])
+        self.assert_references("oath ids 2678-86", list(range(2678, 2687)))
+        self.assert_references("oath ids 95-105", list(range(95, 106)))
+
+    def test_implausible_ranges_are_two_ids(self):
+        last = 10 + MAX_OATH_ID_RANGE
+        self.assert_references(f"oath ids 10-{last}", list(range(10, last + 1)))
+        self.assert_references(f"oath ids 10-{last + 1}", [10, last + 1])
+        self.assert_references("oath ids 300-200", [200, 300])
+        self.assert_references("oath ids 1916-1", [1911, 1916])
+
+    def test_sorted_without_repeats(self):
+        self.assert_references("oath ids 9, 3-4 and oath id 3", [3, 4, 9])
+
+    def test_no_references(self):
+        self.assert_references("", [])
+        self.assert_references("the oath is sworn 3 times", [])
+        self.assert_references("oath idea 5", [])
+        self.assert_references("Oaths 12-14", [])
+
+
+if __name__ == "__main__":
+    unittest.main()
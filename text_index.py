@@ -0,0 +1,228 @@
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+
+# the free-text fields of an extracted oath that are indexed
+TEXT_FIELDS = [
+    "remarks",
+    "impact",
+    "if_taken",
+    "if_refused",
+    "if_kept",
+    "if_broken",
+    "consequences_of_breach",
+    "statement",
+]
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# positions of consecutive fields are this far apart, so phrases never
+# match across the end of one field and the start of the next
+FIELD_GAP = 1000
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def oath_label(oath):
+    return f"{oath.get('author', '')}, {oath.get('title', '')} {oath.get('reference', '')}".strip()
+
+
+def build_index(records, path):
+    """
+    Write an inverted index of the TEXT_FIELDS of records to a new SQLite
+    file at path: each term maps to its postings, a JSON list of
+    [oath_id, [positions]] sorted by oath_id. Returns the number of oaths.
+    """
+    postings = {}
+    docs = []
+    for oath in records:
+        oath_id = oath.get("oath_id")
+        if not oath_id:
+            continue
+        position = 0
+        length = 0
+        for field in TEXT_FIELDS:
+            tokens = tokenize(oath.get(field) or "")
+            for offset, token in enumerate(tokens):
+                postings.setdefault(token, {}).setdefault(oath_id, []).append(
+                    position + offset
+                )
+            position += len(tokens) + FIELD_GAP
+            length += len(tokens)
+        docs.append((oath_id, length, oath_label(oath)))
+
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    with db:
+        db.executescript(
+            """
+            CREATE TABLE terms (term TEXT PRIMARY KEY, postings TEXT NOT NULL);
+            CREATE TABLE docs (oath_id INTEGER PRIMARY KEY, length INTEGER, label TEXT);
+            """
+        )
+        db.executemany("INSERT INTO docs VALUES (?, ?, ?)", docs)
+        db.executemany(
+            "INSERT INTO terms VALUES (?, ?)",
+            (
+                (term, json.dumps(sorted(by_oath.items())))
+                for term, by_oath in postings.items()
+            ),
+        )
+    db.close()
+    os.replace(tmp_path, path)
+    return len(docs)
+
+
+def parse_query(query):
+    """
+    'zeus "false oath" OR perjury' -> [[["zeus"], ["false", "oath"]], [["perjury"]]]
+    Groups separated by OR are alternatives; within a group every term and
+    quoted phrase must match. Each term or phrase is a list of tokens.
+    """
+    groups = [[]]
+    for match in re.finditer(r'"([^"]*)"|(\S+)', query):
+        phrase, word = match.groups()
+        if word == "OR":
+            groups.append([])
+            continue
+        tokens = tokenize(phrase if phrase is not None else word)
+        if tokens:
+            groups[-1].append(tokens)
+    return [group for group in groups if group]
+
+
+class TextIndex:
+    """
+    Reads an index written by build_index; postings are loaded from disk
+    only for the terms a query uses.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.lengths = dict(self.db.execute("SELECT oath_id, length FROM docs"))
+        self.average_length = sum(self.lengths.values()) / max(len(self.lengths), 1)
+        self.cache = {}
+
+    def postings(self, term):
+        """
+        {oath_id: [positions]} for term
+        """
+        if term not in self.cache:
+            row = self.db.execute(
+                "SELECT postings FROM terms WHERE term = ?", (term,)
+            ).fetchone()
+            self.cache[term] = (
+                {oath_id: p for oath_id, p in json.loads(row[0])} if row else {}
+            )
+        return self.cache[term]
+
+    def phrase_matches(self, tokens):
+        """
+        The oath ids containing tokens as consecutive words
+        """
+        lists = [self.postings(token) for token in tokens]
+        oath_ids = set(lists[0]).intersection(*lists[1:])
+        if len(tokens) == 1:
+            return oath_ids
+        matches = set()
+        for oath_id in oath_ids:
+            starts = set(lists[0][oath_id])
+            for offset, postings in enumerate(lists[1:], 1):
+                starts &= {position - offset for position in postings[oath_id]}
+                if not starts:
+                    break
+            if starts:
+                matches.add(oath_id)
+        return matches
+
+    def score(self, oath_id, terms):
+        """
+        BM25 score of one oath for the query terms
+        """
+        total = 0.0
+        count = len(self.lengths)
+        length = self.lengths[oath_id]
+        for term in terms:
+            postings = self.postings(term)
+            if oath_id not in postings:
+                continue
+            frequency = len(postings[oath_id])
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            norm = frequency + K1 * (1 - B + B * length / self.average_length)
+            total += idf * frequency * (K1 + 1) / norm
+        return total
+
+    def search(self, query, limit=20):
+        """
+        [(score, oath_id)] best first, for a query in parse_query syntax
+        """
+        groups = parse_query(query)
+        matches = set()
+        for group in groups:
+            group_matches = self.phrase_matches(group[0])
+            for tokens in group[1:]:
+                if not group_matches:
+                    break
+                group_matches &= self.phrase_matches(tokens)
+            matches |= group_matches
+        terms = {token for group in groups for tokens in group for token in tokens}
+        ranked = sorted(
+            ((self.score(oath_id, terms), oath_id) for oath_id in matches),
+            key=lambda result: (-result[0], result[1]),
+        )
+        return ranked[:limit] if limit else ranked
+
+    def label(self, oath_id):
+        return self.db.execute(
+            "SELECT label FROM docs WHERE oath_id = ?", (oath_id,)
+        ).fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Full-text index over the free-text fields of extracted oaths"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser(
+        "build", help="index extracted oaths (JSON lines on stdin)"
+    )
+    build.add_argument("-o", "--output", default="oaths.idx")
+    query = commands.add_parser(
+        "query",
+        help='search the index: words must all match, "quoted phrases" match '
+        "consecutive words, OR separates alternatives",
+    )
+    query.add_argument("query")
+    query.add_argument("-i", "--index", default="oaths.idx")
+    query.add_argument("-n", "--limit", type=int, default=20, help="0 for all results")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        records = (json.loads(line) for line in sys.stdin)
+        count = build_index(records, args.output)
+        sys.stderr.write(f"Indexed {count} oaths in {args.output}\n")
+        return
+
+    index = TextIndex(args.index)
+    for score, oath_id in index.search(args.query, args.limit):
+        print(f"{oath_id}\t{score:.3f}\t{index.label(oath_id)}")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
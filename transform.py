@@ -1,14 +1,50 @@
 import re
 import json
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Tag
+from bs4.builder import builder_registry
+from agent_registry import AgentRegistry, intern_agents
+from extract_cache import ExtractionCache
+from pages import is_page_source, oath_files, page_exists, read_page
+from records import write_records
+from shards import write_shards
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+import argparse
+import heapq
 import os
 import sys
+import time
+
+
+# lxml and html5lib are optional: uv sync --extra parsers
+PARSERS = ("html.parser", "lxml", "html5lib")
+
+# bump whenever a change to the handlers changes what is extracted,
+# so cached extractions from older code are not reused
+EXTRACTOR_VERSION = "3"
+
+TITLE_PATTERN = re.compile(r"<title[^>]*>.*?</title>", re.IGNORECASE | re.DOTALL)
+CONTENT_PATTERN = re.compile(r"<div[^>]*\bid=[\"']?content\b", re.IGNORECASE)
 
 
 def err_print(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
 
+def installed_parser(name):
+    """
+    argparse type for a --parser choice: name, if its tree builder is
+    installed, so a missing one is a usage error rather than a traceback
+    """
+    if name in PARSERS and builder_registry.lookup(name) is None:
+        raise argparse.ArgumentTypeError(
+            f"the {name} parser is not installed "
+            f"(pip install {name}, or uv sync --extra parsers)"
+        )
+    return name
+
+
 def strip_commas(text):
     """
     strip commas if on ends of the text
@@ -16,213 +52,383 @@ def strip_commas(text):
     return text.strip().strip(",").strip()
 
 
-def handle_element_default(name, element):
+def text_value(name, element):
     # convert br to p
     for br in element.find_all("br"):
         br.replace_with("\n")
-    yield name, element.get_text().strip()
-
-
-def handle_title(name, element):
-    # Implement handling of title
-    yield from handle_element_default(name, element)
-
-
-def handle_h2(name, element):
-    "<h2><strong>Oath ID 3885: Euripides, <em>Iphigenia Aulidensis</em>, 1006-7,</strong> (literary, Trag., 405)</h2>"
-    text = str(element)
-    match = re.search(r"<h2><strong>Oath ID \d+: (.*?)<em>", text)
-    if not match:
-        err_print("Problem with match finding author", text)
-    else:
-        author = match.group(1).strip()
-        yield "author", strip_commas(author)
-    work_title = element.find("em").get_text(strip=True)
-    if work_title:
-        yield "title", strip_commas(work_title)
-    match = re.search(r"</em>(.*?),</strong>", text)
-    if not match:
-        err_print("Problem with match finding reference", text)
-    else:
-        reference = match.group(1).strip()
-        yield "reference", strip_commas(reference)
-    match = re.search(r"</strong>\s*(.*?)\s*</h2>", text)
-    if not match:
-        err_print("Problem with finding meta text", text)
-        return
-    parts3 = match.group(1)[1:-1].split(",")
-    if len(parts3) != 3:
-        err_print("Problem with parts3 (should be three)", parts3)
-    else:
-        work_type = parts3[0].strip()
-        genre = parts3[1].strip()
-        work_date = parts3[2].strip()
-        yield "work_type", strip_commas(work_type)
-        yield "genre", strip_commas(genre)
-        yield "work_date", strip_commas(work_date)
-
+    return element.get_text().strip()
 
-def handle_date(name, element):
-    # Implement handling of date
-    yield from handle_element_default(name, element)
 
-
-def handle_reference_type(name, element):
-    # Implement handling of reference type
-    yield from handle_element_default(name, element)
+def row_texts_value(name, element):
+    """
+    The text of each row of the table in element
+    """
+    return [row.get_text(strip=True) for row in element.find_all("tr")]
 
 
-def handle_state(name, element):
-    # Implement handling of state
-    yield from handle_element_default(name, element)
+AGENT_PATTERN = re.compile(r"^(.*?)(\((?:male|female|n/a).*)")
 
 
-def handle_sw_row(stype, element):
-    text = element.get_text(strip=True)
-    match = re.search(r"^(.*?)(\((?:male|female|n/a).*)", text)
+def agent_from_row(stype, row):
+    """
+    Friend John (male, adolescent, free, Athenian)
+      -> {"agent": "Friend John", "gender": "male", "age": "adolescent", ...}
+    A gender of n/a is taken from the name if it says (male) or (female).
+    Returns None, after reporting, if the row does not look like that.
+    """
+    text = row.get_text(strip=True)
+    match = AGENT_PATTERN.search(text)
     if not match:
         err_print(f"Problem with match finding {stype}", text)
-    else:
-        part_before = match.group(1).strip()
-        part_after = match.group(2).strip()
-        # remove parens
-        part_after = part_after[1:-1]
-        parts = part_after.split(",")
-        if len(parts) != 4:
-            err_print("Problem with parts (should be four)", parts)
-        else:
-            gender = parts[0].strip()
-            age = parts[1].strip()
-            status = parts[2].strip()
-            origin = parts[3].strip()
-            if gender == "n/a":
-                if "(female)" in part_before:
-                    gender = "female"
-                elif "(male)" in part_before:
-                    gender = "male"
-            agent = part_before
-            dict = {
-                "agent": agent,
-                "gender": gender,
-                "age": age,
-                "status": status,
-                "origin": origin,
-            }
-            yield stype, dict
-    # yield from handle_element_default(stype, element)
+        return None
+    part_before = match.group(1).strip()
+    part_after = match.group(2).strip()
+    # remove parens
+    part_after = part_after[1:-1]
+    parts = part_after.split(",")
+    if len(parts) != 4:
+        err_print("Problem with parts (should be four)", parts)
+        return None
+    gender = parts[0].strip()
+    age = parts[1].strip()
+    status = parts[2].strip()
+    origin = parts[3].strip()
+    if gender == "n/a":
+        if "(female)" in part_before:
+            gender = "female"
+        elif "(male)" in part_before:
+            gender = "male"
+    return {
+        "agent": part_before,
+        "gender": gender,
+        "age": age,
+        "status": status,
+        "origin": origin,
+    }
+
+
+def agents_value(name, element):
+    agents = (agent_from_row(name, row) for row in element.find_all("tr"))
+    return [agent for agent in agents if agent is not None]
+
+
+# how a field's value cell is turned into its value, by extraction kind
+VALUE_EXTRACTORS = {
+    "text": text_value,
+    "rows": row_texts_value,
+    "agents": agents_value,
+}
+
+# The fields of an oath page: the row label as it appears on the page,
+# the extraction kind (see VALUE_EXTRACTORS) and the output key.
+# A new field only needs an entry here.
+FIELD_SPECS = [
+    ("Title:", "text", "title"),
+    ("Date:", "text", "date"),
+    ("Reference type:", "text", "reference_type"),
+    ("State:", "text", "state"),
+    ("Swearer:", "agents", "swearer"),
+    ("Swearee:", "agents", "swearee"),
+    ("Proposed by:", "rows", "proposed_by"),
+    ("If taken:", "text", "if_taken"),
+    ("If refused:", "text", "if_refused"),
+    ("If kept:", "text", "if_kept"),
+    ("If broken:", "text", "if_broken"),
+    ("Taken:", "text", "taken"),
+    ("Impact:", "text", "impact"),
+    ("Consequences of breach:", "text", "consequences_of_breach"),
+    ("Statement:", "text", "statement"),
+    ("Linguistic:", "text", "linguistic"),
+    ("God(s) invoked:", "rows", "gods_invoked"),
+    ("Remarks:", "text", "remarks"),
+]
+
+
+def compile_field_plan(specs):
+    """
+    Turn field specs into a dispatch table: label -> (key, value extractor)
+    """
+    plan = {}
+    for label, kind, key in specs:
+        if kind not in VALUE_EXTRACTORS:
+            raise ValueError(f"Unknown extraction kind {kind!r} for {label!r}")
+        plan[label] = (key, VALUE_EXTRACTORS[kind])
+    return plan
 
 
-def handle_swearer(name, element):
-    # Implement handling of swearer
-    l = []
-    for row in element.find_all("tr"):
-        _, b = handle_sw_row("swearer", row).__next__()
-        l.append(b)
-    yield "swearer", l
+FIELD_PLAN = compile_field_plan(FIELD_SPECS)
 
+# "oath id 188", "oath id. 1580", "oath ids 545, 559, 561",
+# "oath ids 1367-1370 and 1372", "oath ids 2678-86"
+OATH_REFERENCE_PATTERN = re.compile(
+    r"\boath\s+ids?\.?\s*"
+    r"(\d+(?:\s*[-–]\s*\d+)?(?:\s*(?:,|&|\band\b|\bor\b)\s*(?:and\s+)?\d+(?:\s*[-–]\s*\d+)?)*)",
+    re.IGNORECASE,
+)
+OATH_ID_RANGE_PATTERN = re.compile(r"(\d+)(?:\s*[-–]\s*(\d+))?")
+# longer "ranges" are taken to be two separate ids
+MAX_OATH_ID_RANGE = 100
 
-def handle_swearee(name, element):
-    # Implement handling of swearee
-    l = []
-    for row in element.find_all("tr"):
-        _, b = handle_sw_row("swearee", row).__next__()
-        l.append(b)
-    yield "swearee", l
 
+def oath_references(text):
+    """
+    The sorted oath ids mentioned as "oath id N" in text, with lists and
+    ranges expanded; an abbreviated range end takes the leading digits of
+    the start, so 1916-7 is 1916 and 1917
+    """
+    oath_ids = set()
+    for match in OATH_REFERENCE_PATTERN.finditer(text):
+        for start, end in OATH_ID_RANGE_PATTERN.findall(match.group(1)):
+            first = int(start)
+            oath_ids.add(first)
+            if not end:
+                continue
+            if len(end) < len(start):
+                end = start[: len(start) - len(end)] + end
+            last = int(end)
+            if first < last <= first + MAX_OATH_ID_RANGE:
+                oath_ids.update(range(first, last + 1))
+            else:
+                oath_ids.add(last)
+    return sorted(oath_ids)
 
-def handle_proposed_by(name, element):
-    l = []
-    for row in element.find_all("tr"):
-        text = row.get_text(strip=True)
-        l.append(text)
-    yield name, l
 
+# fields computed from the value of another field: key -> (derived key, function)
+DERIVED_FIELDS = {
+    "remarks": ("related_oaths", oath_references),
+}
 
-def handle_if_taken(name, element):
-    # Implement handling of if taken
-    yield from handle_element_default(name, element)
+# the keys handle_h2 yields
+H2_KEYS = ("author", "title", "reference", "work_type", "genre", "work_date")
 
 
-def handle_if_refused(name, element):
-    # Implement handling of if refused
-    yield from handle_element_default(name, element)
+def record_keys():
+    """
+    Every key an extracted record can have for a labelled row, in the order
+    they appear in a record: oath_id, the h2 fields, then the table rows,
+    each followed by any field derived from it
+    """
+    keys = dict.fromkeys(("oath_id",) + H2_KEYS)
+    for _, _, key in FIELD_SPECS:
+        keys[key] = None
+        if key in DERIVED_FIELDS:
+            keys[DERIVED_FIELDS[key][0]] = None
+    return tuple(keys)
 
 
-def handle_if_kept(name, element):
-    # Implement handling of if kept
-    yield from handle_element_default(name, element)
+RECORD_KEYS = record_keys()
 
+H2_AUTHOR_PATTERN = re.compile(r"Oath ID \d+: (.*)", re.DOTALL)
+H2_REFERENCE_PATTERN = re.compile(r"(.*?),\Z", re.DOTALL)
 
-def handle_if_broken(name, element):
-    # Implement handling of if broken
-    yield from handle_element_default(name, element)
 
+def split_text_around(parent, child):
+    """
+    The text of parent before and after its direct child
+    """
+    before = []
+    after = []
+    parts = before
+    for node in parent.children:
+        if node is child:
+            parts = after
+        elif isinstance(node, Tag):
+            parts.append(node.get_text())
+        else:
+            parts.append(str(node))
+    return "".join(before), "".join(after)
 
-def handle_taken(name, element):
-    # Implement handling of taken
-    yield from handle_element_default(name, element)
 
+def handle_h2(element):
+    "<h2><strong>Oath ID 3885: Euripides, <em>Iphigenia Aulidensis</em>, 1006-7,</strong> (literary, Trag., 405)</h2>"
+    strong = element.find("strong")
+    em = strong.find("em") if strong else None
+    if em is None:
+        err_print("Problem with finding the work title", element)
+        return
+    before_em, after_em = split_text_around(strong, em)
+    match = H2_AUTHOR_PATTERN.search(before_em)
+    if not match:
+        err_print("Problem with match finding author", element)
+    else:
+        author = match.group(1).strip()
+        yield "author", strip_commas(author)
+    work_title = em.get_text(strip=True)
+    if work_title:
+        yield "title", strip_commas(work_title)
+    match = H2_REFERENCE_PATTERN.match(after_em)
+    if not match:
+        err_print("Problem with match finding reference", element)
+    else:
+        reference = match.group(1).strip()
+        yield "reference", strip_commas(reference)
+    _, meta = split_text_around(element, strong)
+    parts3 = meta.strip()[1:-1].split(",")
+    if len(parts3) != 3:
+        err_print("Problem with parts3 (should be three)", parts3)
+    else:
+        work_type = parts3[0].strip()
+        genre = parts3[1].strip()
+        work_date = parts3[2].strip()
+        yield "work_type", strip_commas(work_type)
+        yield "genre", strip_commas(genre)
+        yield "work_date", strip_commas(work_date)
 
-def handle_impact(name, element):
-    # Implement handling of impact
-    yield from handle_element_default(name, element)
 
+def content_slice(text):
+    """
+    Cut a page down to its <title> and everything from the #content div on,
+    so the masthead, nav bar and script are never turned into tree nodes.
+    Returns None if the page does not have both.
+    """
+    title = TITLE_PATTERN.search(text)
+    if not title:
+        return None
+    content = CONTENT_PATTERN.search(text, title.end())
+    if not content:
+        return None
+    return f"<html><head>{title.group(0)}</head><body>{text[content.start() :]}"
 
-def handle_consequences_of_breach(name, element):
-    # Implement handling of consequences of breach
-    yield from handle_element_default(name, element)
 
+def parse_page(text, parser="html.parser", content_only=False):
+    if content_only:
+        text = content_slice(text) or text
+    return BeautifulSoup(text, parser)
 
-def handle_statement(name, element):
-    # Implement handling of statement
-    yield from handle_element_default(name, element)
 
+class Profiler:
+    """
+    Call count, total and max seconds for each step of extraction
+    (soupify, extract_features, handle_h2, field:<key>) and the slowest
+    files. counters() and slowest() can be read at any time; take() hands
+    the raw numbers over to merge() into another Profiler, which is how
+    worker processes report back.
+    """
 
-def handle_linguistic(name, element):
-    # Implement handling of linguistic
-    yield from handle_element_default(name, element)
+    def __init__(self, keep_slowest=10):
+        self.keep_slowest = keep_slowest
+        # step -> [calls, total seconds, max seconds]
+        self.steps = {}
+        # min-heap of (seconds, file), so the fastest is dropped first
+        self.slowest_files = []
+
+    def record(self, step, seconds):
+        stats = self.steps.get(step)
+        if stats is None:
+            self.steps[step] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
 
+    def record_file(self, file, seconds):
+        if len(self.slowest_files) < self.keep_slowest:
+            heapq.heappush(self.slowest_files, (seconds, file))
+        else:
+            heapq.heappushpop(self.slowest_files, (seconds, file))
 
-def handle_gods_invoked(name, element):
-    l = []
-    for row in element.find_all("tr"):
-        god = row.get_text(strip=True)
-        l.append(god)
-    yield name, l
+    def timed(self, step, function):
+        """
+        function, recording the time of each call under step
+        """
 
+        def timed_function(*args):
+            start = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                self.record(step, time.perf_counter() - start)
+
+        return timed_function
+
+    def take(self):
+        raw = (self.steps, self.slowest_files)
+        self.steps = {}
+        self.slowest_files = []
+        return raw
+
+    def merge(self, raw):
+        steps, slowest_files = raw
+        for step, (calls, total, longest) in steps.items():
+            stats = self.steps.setdefault(step, [0, 0.0, 0.0])
+            stats[0] += calls
+            stats[1] += total
+            stats[2] = max(stats[2], longest)
+        for seconds, file in slowest_files:
+            self.record_file(file, seconds)
+
+    def counters(self):
+        return {
+            step: {
+                "calls": calls,
+                "seconds": round(total, 6),
+                "mean_ms": round(1000 * total / calls, 4),
+                "max_ms": round(1000 * longest, 4),
+                "per_second": round(calls / total, 1) if total else None,
+            }
+            for step, (calls, total, longest) in self.steps.items()
+        }
 
-def handle_remarks(name, element):
-    # Implement handling of remarks
-    yield from handle_element_default(name, element)
+    def slowest(self):
+        """
+        [(file, seconds)], slowest first
+        """
+        return [
+            (file, seconds)
+            for seconds, file in sorted(self.slowest_files, reverse=True)
+        ]
+
+    def summary(self):
+        lines = [
+            f"{'step':<32} {'calls':>7} {'total s':>9} {'mean ms':>9} {'max ms':>9}"
+        ]
+        for step, stats in sorted(
+            self.counters().items(), key=lambda item: -item[1]["seconds"]
+        ):
+            lines.append(
+                f"{step:<32} {stats['calls']:>7} {stats['seconds']:>9.3f} "
+                f"{stats['mean_ms']:>9.3f} {stats['max_ms']:>9.3f}"
+            )
+        if self.slowest_files:
+            lines.append("slowest files:")
+            for file, seconds in self.slowest():
+                lines.append(f"  {file} {1000 * seconds:.1f} ms")
+        return "\n".join(lines)
+
+
+def h2_fields(h2):
+    return list(handle_h2(h2))
 
 
 class Scraper:
-    def __init__(self):
+    def __init__(self, parser="html.parser", content_only=False, profile=False):
+        # any BeautifulSoup tree builder: html.parser, lxml or html5lib
+        self.parser = parser
+        # parse only the title and #content div (see content_slice)
+        self.content_only = content_only
         self.soup = None
         self.current_file = None
-        self.handlers = {
-            "title": handle_title,
-            "date": handle_date,
-            "reference_type": handle_reference_type,
-            "state": handle_state,
-            "swearer": handle_swearer,
-            "swearee": handle_swearee,
-            "proposed_by": handle_proposed_by,
-            "if_taken": handle_if_taken,
-            "if_refused": handle_if_refused,
-            "if_kept": handle_if_kept,
-            "if_broken": handle_if_broken,
-            "taken": handle_taken,
-            "impact": handle_impact,
-            "consequences_of_breach": handle_consequences_of_breach,
-            "statement": handle_statement,
-            "linguistic": handle_linguistic,
-            "gods_invoked": handle_gods_invoked,
-            "remarks": handle_remarks,
-        }
+        self.plan = FIELD_PLAN
+        self.handle_h2 = handle_h2
+        # with profile on, every step is timed into self.profiler; with it
+        # off the plain plan is used and the only cost is a None check
+        self.profiler = None
+        self.parse_seconds = 0.0
+        if profile:
+            self.profiler = Profiler()
+            self.plan = {
+                label: (key, self.profiler.timed(f"field:{key}", extract_value))
+                for label, (key, extract_value) in FIELD_PLAN.items()
+            }
+            self.handle_h2 = self.profiler.timed("handle_h2", h2_fields)
 
     def soupify(self, text):
-        self.soup = BeautifulSoup(text, "html.parser")
+        if self.profiler is not None:
+            start = time.perf_counter()
+        self.soup = parse_page(text, self.parser, self.content_only)
+        if self.profiler is not None:
+            self.parse_seconds = time.perf_counter() - start
+            self.profiler.record("soupify", self.parse_seconds)
 
     def extract_features(self):
         title = self.soup.find("title")
@@ -239,20 +445,38 @@ class Scraper:
             yield "oath_id", oath_id
         h2 = self.soup.select_one("#content h2")
         if h2:
-            yield from handle_h2("title", h2)
+            yield from self.handle_h2(h2)
         rows = table_rows(self.soup)
-        filtered_rows = filter_to_features(rows)
-        for td, value in filtered_rows:
-            feature_name = feature_name_from_td(td)
-            handler = self.handlers.get(feature_name)
-            if handler:
-                yield from handler(feature_name, value)
+        for label, value in filter_to_features(rows):
+            field = self.plan.get(label)
+            if field:
+                key, extract_value = field
+                value = extract_value(key, value)
+                yield key, value
+                derived = DERIVED_FIELDS.get(key)
+                if derived:
+                    derived_key, derive = derived
+                    yield derived_key, derive(value)
             else:
+                feature_name = feature_name_from_label(label)
                 err_print("No handler for", feature_name)
-                yield from handle_element_default(feature_name, value)
+                yield feature_name, text_value(feature_name, value)
 
     def extact_features_to_dict(self):
-        return dict(self.extract_features())
+        if self.profiler is None:
+            return dict(self.extract_features())
+        start = time.perf_counter()
+        features = dict(self.extract_features())
+        seconds = time.perf_counter() - start
+        self.profiler.record("extract_features", seconds)
+        self.profiler.record_file(self.current_file, self.parse_seconds + seconds)
+        return features
+
+    def take_profile(self):
+        """
+        The profile recorded since the last call (see Profiler.take), or None
+        """
+        return self.profiler.take() if self.profiler is not None else None
 
 
 # headers = {
@@ -326,21 +550,21 @@ def table_rows(soup):
 
 def filter_to_features(rows):
     """
-    Filter out rows that are not features
+    Filter out rows that are not features, yielding (label, value td)
     """
     for row in rows:
         tds = row.find_all("td")
         if len(tds) >= 2:
-            feature_name = tds[1].get_text(strip=True)
-            if feature_name.endswith(":"):
-                yield tds[1], tds[2]
+            label = tds[1].get_text(strip=True)
+            if label.endswith(":"):
+                yield label, tds[2]
 
 
-def feature_name_from_td(td):
+def feature_name_from_label(label):
     """
-    Convert to feature name from td
+    Convert to feature name from a row label, e.g. "God(s) invoked:" -> gods_invoked
     """
-    text = td.get_text(strip=True)[:-1].lower()
+    text = label[:-1].lower()
     text = text.replace("(", "")
     text = text.replace(")", "")
     return text.replace(" ", "_")
@@ -825,36 +1049,361 @@ function openwin ( url, wintype )
 </html>
 """
 
-if __name__ == "__main__":
+
+def extract_file(scraper, path):
+    """
+    Read and extract the features of one saved oath page
+    """
+    scraper.current_file = os.path.basename(path)
+    html = read_page(path)
+    scraper.soupify(html)
+    return scraper.extact_features_to_dict()
+
+
+# each worker process builds its own Scraper once, in init_worker
+worker_scraper = None
+
+
+def init_worker(scraper_options):
+    global worker_scraper
+    worker_scraper = Scraper(**scraper_options)
+
+
+def extract_file_safely(scraper, path):
+    """
+    Returns (path, features, error, seconds, profile); errors are caught so
+    one bad page does not stop the run. profile is None unless the scraper
+    is profiling.
+    """
+    start = time.perf_counter()
+    try:
+        features = extract_file(scraper, path)
+    except Exception as e:  # noqa: BLE001 - any page error is reported, not raised
+        error = f"{type(e).__name__}: {e}"
+        return path, None, error, time.perf_counter() - start, scraper.take_profile()
+    seconds = time.perf_counter() - start
+    return path, features, None, seconds, scraper.take_profile()
+
+
+def extract_file_in_worker(path):
+    return extract_file_safely(worker_scraper, path)
+
+
+# pages looked up in the cache and handed to the workers at a time by
+# extract_pages, which so holds at most this many results however large
+# the corpus
+WINDOW = 1024
+
+
+@contextmanager
+def path_extractor(jobs, chunksize, scraper_options):
+    """
+    A function extracting a list of paths in order, returning an iterator
+    of (path, features, error, seconds, profile); with jobs > 1 every call
+    shares one process pool
+    """
+    if jobs <= 1:
+        scraper = Scraper(**scraper_options)
+        yield lambda paths: (extract_file_safely(scraper, path) for path in paths)
+        return
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=init_worker, initargs=(scraper_options,)
+    ) as pool:
+
+        def extract(paths):
+            # a few chunks per worker keeps them all busy without much IPC
+            size = chunksize or max(1, len(paths) // (jobs * 4))
+            # map returns results in submission order, so output stays sorted
+            return pool.map(extract_file_in_worker, paths, chunksize=size)
+
+        yield extract
+
+
+def extract_paths(paths, jobs, chunksize, scraper_options):
+    """
+    Extract paths in order, yielding (path, features, error, seconds, profile)
+    """
+    with path_extractor(jobs, chunksize, scraper_options) as extract:
+        yield from extract(paths)
+
+
+def extract_directory(directory, **options):
+    """
+    Extract every page in directory, yielding (path, features, error)
+    in oath id order; options are those of extract_pages
+    """
+    paths = [os.path.join(directory, file) for file in oath_files(directory)]
+    yield from extract_pages(paths, **options)
+
+
+def extract_pages(
+    paths, jobs=1, chunksize=None, cache=None, profiler=None, **scraper_options
+):
+    """
+    Extract the pages at paths, yielding (path, features, error) in order.
+    With jobs > 1 the pages are spread over a process pool.
+    Pages found in cache (an ExtractionCache) are not parsed again.
+    With a profiler (a Profiler) every page's profile is merged into it.
+    scraper_options are passed on to Scraper (parser, content_only).
+    Pages are looked up and extracted WINDOW at a time, so the first
+    results come without reading the whole corpus first.
+    """
+    if profiler is not None:
+        scraper_options["profile"] = True
+    with path_extractor(jobs, chunksize, scraper_options) as extract:
+        for start in range(0, len(paths), WINDOW):
+            window = paths[start : start + WINDOW]
+            cached = {}
+            if cache is not None:
+                for path in window:
+                    try:
+                        features = cache.lookup(path)
+                    except OSError:
+                        # left for the extractor to report
+                        continue
+                    if features is not None:
+                        cached[path] = features
+            results = extract([path for path in window if path not in cached])
+            for path in window:
+                if path in cached:
+                    yield path, cached[path], None
+                    continue
+                path, features, error, seconds, profile = next(results)
+                if profiler is not None and profile is not None:
+                    profiler.merge(profile)
+                if cache is not None and error is None:
+                    cache.store(path, features, seconds)
+                yield path, features, error
+
+
+def compare_parsers(directory, first, second, content_only=False):
+    """
+    Run every page in directory through two parser backends, report each
+    record that differs and the throughput of each backend.
+    Returns the number of differing records.
+    """
+    scrapers = {
+        first: Scraper(first, content_only=content_only),
+        second: Scraper(second, content_only=content_only),
+    }
+    seconds = {first: 0.0, second: 0.0}
+    pages = 0
+    differing = 0
+    for file in oath_files(directory):
+        html = read_page(os.path.join(directory, file))
+        records = {}
+        for name, scraper in scrapers.items():
+            scraper.current_file = file
+            start = time.perf_counter()
+            scraper.soupify(html)
+            records[name] = scraper.extact_features_to_dict()
+            seconds[name] += time.perf_counter() - start
+        pages += 1
+        if records[first] != records[second]:
+            differing += 1
+            a, b = records[first], records[second]
+            for key in sorted(set(a) | set(b)):
+                if a.get(key) != b.get(key):
+                    print(f"{file}: {key}")
+                    print(f"  {first}: {json.dumps(a.get(key))}")
+                    print(f"  {second}: {json.dumps(b.get(key))}")
+    for name in (first, second):
+        rate = pages / seconds[name] if seconds[name] else 0.0
+        print(f"{name}: {pages} pages in {seconds[name]:.2f}s ({rate:.1f} pages/s)")
+    print(f"{differing} of {pages} records differ")
+    return differing
+
+
+def add_extraction_arguments(parser):
+    """
+    Add the directory extraction options shared by the command line tools
+    """
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes for directory mode (default: 1)",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="pages handed to a worker at a time (default: a few chunks per worker)",
+    )
+    parser.add_argument(
+        "--parser",
+        type=installed_parser,
+        choices=PARSERS,
+        default="html.parser",
+        help="BeautifulSoup tree builder (default: html.parser)",
+    )
+    parser.add_argument(
+        "--content-only",
+        action="store_true",
+        help="parse only the <title> and #content div of each page",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="FILE",
+        help="reuse extractions of unchanged pages from this cache file (directory mode)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time each extraction step and report a summary on stderr",
+    )
+
+
+def extracted_records(args, ids=None):
+    """
+    Yield the features of every page (or those whose oath ids are listed
+    in the file ids) in the directory args.path, using the options from
+    add_extraction_arguments. Errors and cache stats go to stderr.
+    """
+    cache = ExtractionCache(args.cache, EXTRACTOR_VERSION) if args.cache else None
+    profiler = Profiler() if args.profile else None
+    failures = 0
+    if ids:
+        with open(ids) as f:
+            oath_ids = sorted({int(line) for line in f if line.strip()})
+        paths = [os.path.join(args.path, f"{oath_id}.html") for oath_id in oath_ids]
+        pages = partial(extract_pages, [path for path in paths if page_exists(path)])
+    else:
+        pages = partial(extract_directory, args.path)
+    for path, features, error in pages(
+        jobs=args.jobs,
+        chunksize=args.chunksize,
+        cache=cache,
+        profiler=profiler,
+        parser=args.parser,
+        content_only=args.content_only,
+    ):
+        if error:
+            failures += 1
+            err_print(f"Error extracting features from {path}: {error}")
+            continue
+        yield features
+    if failures:
+        err_print(f"{failures} file(s) could not be extracted")
+    if cache is not None:
+        cache.evict_missing()
+        err_print(cache.stats())
+        cache.close()
+    if profiler is not None:
+        err_print(profiler.summary())
+
+
+def write_output(records, format):
+    """
+    Write records to stdout as JSON lines or, for format "binary", in the
+    record format of records.py
+    """
+    if format == "binary":
+        write_records(records, sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+        return
+    for features in records:
+        print(json.dumps(features))
+
+
+def main(argv=None):
     # features_json = get_features_from_files("oaths")
     # err_print(features_json)
     # convert_json_to_csv(features_json, "all_features.csv")
     # get_files_for_range(2, 3885)
-    scraper = Scraper()
-    html = example_html
-    args = sys.argv[1:]
-    if args:
-        # is it a directory?
-        if os.path.isdir(args[0]):
-            for file in os.listdir(args[0]):
-                scraper.current_file = file
-                if file.endswith(".html"):
-                    with open(args[0] + "/" + file, "r", errors="ignore") as f:
-                        html = f.read()
-                        scraper.soupify(html)
-                        features = scraper.extact_features_to_dict()
-                        features_json = json.dumps(features)
-                        print(features_json)
+    parser = argparse.ArgumentParser(
+        description="Extract oath features from saved pages, one JSON object per line"
+    )
+    parser.add_argument(
+        "path",
+        nargs="?",
+        help="an oath page, or a directory or archive of pages "
+        "(default: the built-in example)",
+    )
+    add_extraction_arguments(parser)
+    parser.add_argument(
+        "--ids",
+        metavar="FILE",
+        help="extract only the pages with these oath ids, one per line "
+        "(e.g. from fetch.py --changed)",
+    )
+    parser.add_argument(
+        "--compare-parsers",
+        nargs=2,
+        type=installed_parser,
+        choices=PARSERS,
+        metavar=("FIRST", "SECOND"),
+        help="check that two backends give identical records for a directory",
+    )
+    parser.add_argument(
+        "--agent-table",
+        metavar="FILE",
+        help="give swearers and swearees as integer ids into an agent table "
+        "written to FILE, which the json_to_*.py, oath_table.py and "
+        "export_sqlite.py --agent-table options read back",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("json", "binary"),
+        default="json",
+        help="write JSON lines, or the compact binary record format that "
+        "json_to_oaths.py and json_to_agents.py read with --format binary",
+    )
+    parser.add_argument(
+        "--shard-dir",
+        metavar="DIR",
+        help="write the records of a directory to shards in DIR, each sorted "
+        "by oath id, for shards.py to merge",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=1000,
+        help="most records per shard (default: 1000)",
+    )
+    args = parser.parse_args(argv)
+    registry = AgentRegistry() if args.agent_table else None
+
+    if args.compare_parsers:
+        if not (args.path and is_page_source(args.path)):
+            parser.error("--compare-parsers needs a directory or archive")
+        differing = compare_parsers(
+            args.path, *args.compare_parsers, content_only=args.content_only
+        )
+        sys.exit(1 if differing else 0)
+
+    if args.path and is_page_source(args.path):
+        records = extracted_records(args, args.ids)
+        if registry is not None:
+            records = (intern_agents(registry, features) for features in records)
+        if args.shard_dir:
+            paths = write_shards(records, args.shard_dir, args.shard_size)
+            err_print(f"Wrote {len(paths)} shard(s) to {args.shard_dir}")
         else:
-            with open(args[0], "r") as f:
-                scraper.current_file = args[0]
-                html = f.read()
-                scraper.soupify(html)
-                features = scraper.extact_features_to_dict()
-                features_json = json.dumps(features)
-                print(features_json)
+            write_output(records, args.format)
+        if registry is not None:
+            registry.report_conflicts()
+            registry.write_csv(args.agent_table)
+        return
+
+    scraper = Scraper(args.parser, content_only=args.content_only, profile=args.profile)
+    if args.path:
+        # a page file, or a page in an archive such as oaths.pack/12.html
+        scraper.current_file = args.path
+        html = read_page(args.path)
     else:
-        scraper.soupify(html)
-        features = scraper.extact_features_to_dict()
-        features_json = json.dumps(features)
-        print(features_json)
+        scraper.current_file = "example_html"
+        html = example_html
+    scraper.soupify(html)
+    features = scraper.extact_features_to_dict()
+    if registry is not None:
+        intern_agents(registry, features)
+        registry.write_csv(args.agent_table)
+    write_output([features], args.format)
+    if scraper.profiler is not None:
+        err_print(scraper.profiler.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import argparse
+import csv
+import os
+import time
+
+from extract_cache import ExtractionCache
+from json_to_oaths import normalize_dict
+from pages import oath_file_key
+from transform import (
+    EXTRACTOR_VERSION,
+    Profiler,
+    add_extraction_arguments,
+    err_print,
+    extract_pages,
+)
+
+
+def snapshot(directory):
+    """
+    {file name: (mtime in ns, size)} of the *.html pages in directory
+    """
+    pages = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(".html") and entry.is_file():
+                stat = entry.stat()
+                pages[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    return pages
+
+
+def write_csv_atomically(path, rows):
+    """
+    Write dict rows to path through a temporary file and a rename, so
+    readers see the old CSV or the new one, never a partial one
+    """
+    fieldnames = {}
+    for row in rows:
+        fieldnames.update(dict.fromkeys(row))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", newline="") as csvfile:
+        if rows:
+            writer = csv.DictWriter(csvfile, fieldnames=list(fieldnames))
+            writer.writeheader()
+            writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+
+class Watcher:
+    """
+    Keeps oaths.csv and agents.csv in step with a directory of pages. Each
+    sync() re-extracts only the pages whose mtime or size changed, upserts
+    their rows (oaths keyed by oath_id, agents by name) and, if any row
+    changed, rewrites both CSVs, which come out as a full pipeline.py run
+    would write them.
+    """
+
+    def __init__(self, directory, oaths_path, agents_path, **extraction_options):
+        self.directory = directory
+        self.oaths_path = oaths_path
+        self.agents_path = agents_path
+        self.extraction_options = extraction_options
+        self.pages = {}
+        # file name -> oath id, oath id -> oaths.csv row, oath id -> agents
+        self.oath_ids = {}
+        self.rows = {}
+        self.agents = {}
+        self.written = False
+
+    def changes(self):
+        """
+        (changed or new file names, removed file names, current snapshot)
+        """
+        current = snapshot(self.directory)
+        changed = [
+            name for name, stat in current.items() if self.pages.get(name) != stat
+        ]
+        removed = [name for name in self.pages if name not in current]
+        return sorted(changed, key=oath_file_key), removed, current
+
+    def remove(self, name):
+        """
+        Drop the rows of page name; returns whether it had any
+        """
+        oath_id = self.oath_ids.pop(name, None)
+        if oath_id is None:
+            return False
+        self.rows.pop(oath_id, None)
+        self.agents.pop(oath_id, None)
+        return True
+
+    def upsert(self, name, oath):
+        """
+        Replace the rows of page name with those of oath; returns whether
+        they changed
+        """
+        oath_id = oath.get("oath_id")
+        if not oath_id:
+            # not an oath result page (e.g. the search form)
+            return self.remove(name)
+        row = normalize_dict(oath)
+        agents = oath.get("swearer", []) + oath.get("swearee", [])
+        if (
+            self.oath_ids.get(name) == oath_id
+            and self.rows[oath_id] == row
+            and self.agents[oath_id] == agents
+        ):
+            return False
+        self.remove(name)
+        self.oath_ids[name] = oath_id
+        self.rows[oath_id] = row
+        self.agents[oath_id] = agents
+        return True
+
+    def agent_rows(self):
+        """
+        The first attribute set of each agent name, in oath id order, as
+        pipeline.py and json_to_agents.py pick them
+        """
+        first = {}
+        for oath_id in sorted(self.agents):
+            for agent in self.agents[oath_id]:
+                first.setdefault(agent["agent"], agent)
+        return list(first.values())
+
+    def sync(self):
+        """
+        Bring the CSVs up to date with the directory; returns the number of
+        pages re-extracted or removed
+        """
+        changed, removed, current = self.changes()
+        if not changed and not removed:
+            return 0
+        modified = False
+        for name in removed:
+            modified |= self.remove(name)
+        paths = [os.path.join(self.directory, name) for name in changed]
+        for path, features, error in extract_pages(paths, **self.extraction_options):
+            name = os.path.basename(path)
+            if error:
+                err_print(f"Error extracting features from {path}: {error}")
+                # left out, as pipeline.py would; its stat stays in the
+                # snapshot, so it is retried once the file changes again
+                modified |= self.remove(name)
+                continue
+            modified |= self.upsert(name, features)
+        self.pages = current
+        if modified or not self.written:
+            write_csv_atomically(
+                self.oaths_path, [self.rows[oath_id] for oath_id in sorted(self.rows)]
+            )
+            write_csv_atomically(self.agents_path, self.agent_rows())
+            self.written = True
+        return len(changed) + len(removed)
+
+    def poll(self):
+        """
+        sync(), then evict the cache entries of removed and rewritten pages,
+        commit the cache and report what was done
+        """
+        start = time.perf_counter()
+        count = self.sync()
+        if not count:
+            return
+        cache = self.extraction_options.get("cache")
+        if cache is not None:
+            cache.evict_missing()
+            cache.commit()
+            err_print(cache.stats())
+        profiler = self.extraction_options.get("profiler")
+        if profiler is not None:
+            err_print(profiler.summary())
+            self.extraction_options["profiler"] = Profiler()
+        seconds = time.perf_counter() - start
+        err_print(f"Updated {count} page(s) in {seconds:.2f}s")
+
+    def run(self, interval=2.0):
+        while True:
+            self.poll()
+            time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Watch a directory of oath pages and keep oaths.csv and "
+        "agents.csv up to date, re-extracting only new or changed pages"
+    )
+    parser.add_argument("directory", nargs="?", default="oaths")
+    parser.add_argument("--oaths", default="oaths.csv")
+    parser.add_argument("--agents", default="agents.csv")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=2.0,
+        help="seconds between polls of the directory (default: 2)",
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="sync once and exit instead of watching"
+    )
+    add_extraction_arguments(parser)
+    args = parser.parse_args(argv)
+    cache = ExtractionCache(args.cache, EXTRACTOR_VERSION) if args.cache else None
+    watcher = Watcher(
+        args.directory,
+        args.oaths,
+        args.agents,
+        jobs=args.jobs,
+        chunksize=args.chunksize,
+        cache=cache,
+        profiler=Profiler() if args.profile else None,
+        parser=args.parser,
+        content_only=args.content_only,
+    )
+    try:
+        if args.once:
+            watcher.poll()
+        else:
+            watcher.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == "__main__":
+    main()